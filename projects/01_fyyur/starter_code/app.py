@@ -2,18 +2,38 @@
 # Imports
 #----------------------------------------------------------------------------#
 
+import os
+import io
 import json
+import csv
+import sys
+import hmac
+import time
+import zlib
+import click
 import dateutil.parser
 import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+import babel.dates
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort, jsonify, \
+  stream_with_context
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
+from cache import PageCache, cache_from_config
+from pooling import engine_options, pool_status
+from routing import RoutingSQLAlchemy, ReplicaRouter, read_only
+from profiling import QueryProfiler
+from async_db import AsyncDatabase
+import partitions
 from flask_migrate import Migrate
 from datetime import datetime
+from itertools import groupby, islice
+from werkzeug.datastructures import MultiDict
+from contextlib import contextmanager
+from functools import wraps
+from sqlalchemy import event
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
@@ -21,7 +41,11 @@ from datetime import datetime
 app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
-db = SQLAlchemy(app)
+db = RoutingSQLAlchemy(app)
+replicas = ReplicaRouter(lambda uri: engine_options(uri, os.environ))
+replicas.init_app(app)
+profiler = QueryProfiler(app)
+async_db = AsyncDatabase(app)
 migrate = Migrate(app, db)
 
 # TODO: connect to a local postgresql database
@@ -40,9 +64,12 @@ class Venue(db.Model):
     phone = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
+    # kept up to date on every show insert and delete, see Show counts below
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
     artists = db.relationship("Artist", secondary="shows")
-    genres = db.relationship("Genre", backref="venues")
+    genres = db.relationship("Genre", secondary="venue_genres", backref="venues")
 
 
 class Artist(db.Model):
@@ -55,14 +82,29 @@ class Artist(db.Model):
     # genres = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
+    # kept up to date on every show insert and delete, see Show counts below
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
     venues = db.relationship('Venue', secondary="shows")
-    genres = db.relationship("Genre", backref="artists")
+    genres = db.relationship("Genre", secondary="artist_genres", backref="artists")
 
 
 # TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
+# On PostgreSQL the a6f0d3b9c217 migration partitions shows by month of
+# start_time, see partitions.py. Keep start_time filters on the bare column
+# (start_time > :now, not date(start_time) > ...) so the planner can skip
+# the months outside them.
 class Show(db.Model):
     __tablename__="shows"
+    __table_args__ = (
+        # keyset pagination of /shows walks (start_time, id)
+        db.Index('ix_shows_start_time_id', 'start_time', 'id'),
+        # detail pages and upcoming-show counts filter on one side of the
+        # show and on start_time
+        db.Index('ix_shows_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_shows_artist_id_start_time', 'artist_id', 'start_time'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
     venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
@@ -71,23 +113,808 @@ class Show(db.Model):
     venue = db.relationship("Venue", backref=db.backref("shows", cascade="all, delete"))
 
 class Genre(db.Model):
+    # one row per genre name, shared by every venue and artist through the
+    # venue_genres / artist_genres association tables
     __tablename__ = "genres"
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(), nullable=False)
-    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'))
-    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'))
+    name = db.Column(db.String(), nullable=False, unique=True)
+
+# the primary keys serve "genres of a venue/artist", the genre_id indexes
+# serve "venues/artists of a genre"
+venue_genres = db.Table('venue_genres',
+    db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('genres.id'), primary_key=True),
+    db.Index('ix_venue_genres_genre_id_venue_id', 'genre_id', 'venue_id'),
+)
+
+artist_genres = db.Table('artist_genres',
+    db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('genres.id'), primary_key=True),
+    db.Index('ix_artist_genres_genre_id_artist_id', 'genre_id', 'artist_id'),
+)
+
+# a single row holding the time up to which shows count as past
+show_count_watermark = db.Table('show_count_watermark',
+    db.Column('id', db.Integer, primary_key=True),
+    db.Column('rolled_over_at', db.DateTime, nullable=False),
+)
+
+# shows joined to their venue and artist, by area and day, for the
+# /shows?city= calendar; kept current on every flush, see Show calendar.
+# show_id has no foreign key: on PostgreSQL shows is partitioned and its
+# primary key is (id, start_time).
+show_calendar = db.Table('show_calendar',
+    db.Column('show_id', db.Integer, primary_key=True),
+    db.Column('city', db.String(120)),
+    db.Column('state', db.String(120)),
+    db.Column('start_date', db.Date, nullable=False),
+    db.Column('start_time', db.DateTime, nullable=False),
+    db.Column('venue_id', db.Integer, nullable=False),
+    db.Column('venue_name', db.String),
+    db.Column('artist_id', db.Integer, nullable=False),
+    db.Column('artist_name', db.String),
+    db.Column('artist_image_link', db.String(500)),
+    # one range scan per city and date range, already in listing order
+    db.Index('ix_show_calendar_city_start', 'city', 'start_date', 'start_time', 'show_id'),
+)
+
+
+class GenreIds(object):
+  # The name -> id map of the genres. Reloads build a new dict and swap it
+  # in, so readers in other threads never see it empty or half filled.
+
+  def __init__(self):
+      self.ids = {}
+
+  def get(self, name):
+      ids = self.ids
+      if name not in ids:
+          ids = self.ids = dict(db.session.query(Genre.name, Genre.id).all())
+      return ids.get(name)
+
+  def clear(self):
+      self.ids = {}
+
+genre_id_cache = GenreIds()
+
+def genre_id(name):
+  # Id of the genre called `name`, or None. The name -> id map is small and
+  # almost never changes, so it is loaded once per process and reloaded only
+  # on a miss or after this process adds or removes a genre.
+  return genre_id_cache.get(name)
+
+def genres_named(names):
+  # Genre rows for the given names, creating the ones that do not exist yet.
+  names = list(dict.fromkeys(names))
+  genres = Genre.query.filter(Genre.name.in_(names)).all() if names else []
+  existing = set(genre.name for genre in genres)
+  genres.extend(Genre(name=name) for name in names if name not in existing)
+  return genres
+
+@event.listens_for(Genre, 'after_insert')
+@event.listens_for(Genre, 'after_delete')
+def clear_genre_id_cache(mapper, connection, target):
+  genre_id_cache.clear()
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def clear_genre_id_cache_on_rollback(session, previous_transaction):
+  # a reload inside the rolled back transaction may have seen genres that
+  # were never committed
+  genre_id_cache.clear()
+
+#----------------------------------------------------------------------------#
+# Show counts.
+#----------------------------------------------------------------------------#
+
+# Venue and Artist rows carry their upcoming and past show counts so the list
+# and search pages read them without touching shows. "Upcoming" means after
+# the watermark in show_count_watermark rather than after now: inserts and
+# deletes adjust the counts against it, and the roll-over-shows command moves
+# the shows that started since then from upcoming to past and advances it.
+# Run it periodically (e.g. every few minutes from cron); check-show-counts
+# recomputes every count and reports drift.
+
+@event.listens_for(show_count_watermark, 'after_create')
+def create_show_count_watermark(target, connection, **kw):
+  connection.execute(show_count_watermark.insert(), {'id': 1, 'rolled_over_at': datetime.now()})
+
+def rolled_over_at():
+  return db.select(show_count_watermark.c.rolled_over_at).scalar_subquery()
+
+def count_show(connection, venue_id, artist_id, start_time, delta):
+  # Adds delta (1 or -1) to the upcoming or past count of a show's venue and
+  # artist, in one UPDATE each.
+  upcoming = db.cast(db.literal(start_time, db.DateTime) > rolled_over_at(), db.Integer) * delta
+  for model, owner_id in ((Venue, venue_id), (Artist, artist_id)):
+      connection.execute(model.__table__.update().where(model.id == owner_id).values(
+        upcoming_shows_count=model.upcoming_shows_count + upcoming,
+        past_shows_count=model.past_shows_count + delta - upcoming))
+
+@event.listens_for(Show, 'after_insert')
+def count_inserted_show(mapper, connection, target):
+  count_show(connection, target.venue_id, target.artist_id, target.start_time, 1)
+
+@event.listens_for(Show, 'after_delete')
+def count_deleted_show(mapper, connection, target):
+  count_show(connection, target.venue_id, target.artist_id, target.start_time, -1)
+
+@event.listens_for(Show, 'after_update')
+def count_updated_show(mapper, connection, target):
+  state = db.inspect(target)
+  history = [state.attrs[key].history for key in ('venue_id', 'artist_id', 'start_time')]
+  if not any(item.has_changes() for item in history):
+      return
+  old = [item.deleted[0] if item.deleted else getattr(target, key)
+         for key, item in zip(('venue_id', 'artist_id', 'start_time'), history)]
+  count_show(connection, *(old + [-1]))
+  count_show(connection, target.venue_id, target.artist_id, target.start_time, 1)
+
+def actual_show_counts(model):
+  # Correlated (upcoming, past) counts of a Venue or Artist row from shows.
+  show_fk = Show.venue_id if model is Venue else Show.artist_id
+  shows = db.select(db.func.count(Show.id)).where(show_fk == model.id)
+  return (shows.where(Show.start_time > rolled_over_at()).scalar_subquery(),
+          shows.where(Show.start_time <= rolled_over_at()).scalar_subquery())
+
+def recount_shows(model, ids=None):
+  # Recomputes the counts of the given (or all) rows of model from shows;
+  # used after bulk show inserts that bypass count_show.
+  upcoming, past = actual_show_counts(model)
+  update = model.__table__.update().values(upcoming_shows_count=upcoming, past_shows_count=past)
+  if ids is not None:
+      update = update.where(model.id.in_(ids))
+  db.session.execute(update)
+
+def roll_over_shows(now=None):
+  # Moves the shows that started after the watermark and up to `now` from
+  # the upcoming to the past counts and advances the watermark, in one
+  # transaction. Returns the number of shows moved.
+  if now is None:
+      now = datetime.now()
+  since = db.session.execute(
+    db.select(show_count_watermark.c.rolled_over_at).with_for_update()).scalar()
+  started = db.and_(Show.start_time > since, Show.start_time <= now)
+  moved = 0
+  for model, show_fk in ((Venue, Show.venue_id), (Artist, Show.artist_id)):
+      counts = db.session.query(show_fk, db.func.count(Show.id))\
+        .filter(started).group_by(show_fk).all()
+      if counts:
+          table = model.__table__
+          db.session.execute(table.update().where(table.c.id == db.bindparam('owner_id')).values(
+            upcoming_shows_count=table.c.upcoming_shows_count - db.bindparam('started'),
+            past_shows_count=table.c.past_shows_count + db.bindparam('started')),
+            [{'owner_id': owner_id, 'started': count} for owner_id, count in counts])
+      # every show has one venue and one artist, so both sums agree
+      moved = sum(count for _, count in counts)
+  db.session.execute(show_count_watermark.update().values(rolled_over_at=now))
+  db.session.commit()
+  return moved
+
+def show_count_drift(model):
+  # (id, stored upcoming, actual upcoming, stored past, actual past) of every
+  # row of model whose stored counts disagree with shows.
+  upcoming, past = actual_show_counts(model)
+  counts = db.select(
+      model.id, model.upcoming_shows_count, upcoming.label('actual_upcoming'),
+      model.past_shows_count, past.label('actual_past')
+    ).subquery()
+  return db.session.execute(db.select(counts).where(db.or_(
+      counts.c.upcoming_shows_count != counts.c.actual_upcoming,
+      counts.c.past_shows_count != counts.c.actual_past,
+    )).order_by(counts.c.id)).all()
+
+#----------------------------------------------------------------------------#
+# Show calendar.
+#----------------------------------------------------------------------------#
+
+# show_calendar holds a copy of every show with the venue and artist fields
+# the listing shows, so "shows in a city between two dates" is one index
+# range scan instead of a join over all shows. Mapper events rewrite the
+# affected rows in the same flush as the change, so the calendar commits
+# (or rolls back) together with it. refresh-show-calendar rebuilds it all.
+
+def calendar_rows(condition=None):
+  query = db.select(
+      Show.id, Venue.city, Venue.state, db.func.date(Show.start_time), Show.start_time,
+      Venue.id, Venue.name, Artist.id, Artist.name, Artist.image_link
+    ).join(Venue, Show.venue_id == Venue.id)\
+    .join(Artist, Show.artist_id == Artist.id)
+  if condition is not None:
+      query = query.where(condition)
+  return query
+
+def refresh_show_calendar(connection, condition=None):
+  # Rewrites the calendar rows of the shows matching condition, or of every
+  # show without one.
+  delete = show_calendar.delete()
+  if condition is not None:
+      delete = delete.where(show_calendar.c.show_id.in_(db.select(Show.id).where(condition)))
+  connection.execute(delete)
+  connection.execute(show_calendar.insert().from_select(
+    [column.key for column in show_calendar.columns], calendar_rows(condition)))
+
+def changed(target, keys):
+  state = db.inspect(target)
+  return any(state.attrs[key].history.has_changes() for key in keys)
+
+@event.listens_for(Show, 'after_insert')
+@event.listens_for(Show, 'after_update')
+def calendar_show_saved(mapper, connection, target):
+  refresh_show_calendar(connection, Show.id == target.id)
+
+@event.listens_for(Show, 'after_delete')
+def calendar_show_deleted(mapper, connection, target):
+  connection.execute(show_calendar.delete().where(show_calendar.c.show_id == target.id))
+
+@event.listens_for(Venue, 'after_update')
+def calendar_venue_updated(mapper, connection, target):
+  if changed(target, ('name', 'city', 'state')):
+      refresh_show_calendar(connection, Show.venue_id == target.id)
+
+@event.listens_for(Artist, 'after_update')
+def calendar_artist_updated(mapper, connection, target):
+  if changed(target, ('name', 'image_link')):
+      refresh_show_calendar(connection, Show.artist_id == target.id)
+
+#----------------------------------------------------------------------------#
+# Search index.
+#----------------------------------------------------------------------------#
+
+# On Postgres the search columns carry pg_trgm GIN indexes (see the
+# b7e2c4a9d1f3 migration), which serve ILIKE '%term%' directly. SQLite has no
+# trigram operator class, so there each searchable table gets an FTS5 shadow
+# table with the trigram tokenizer, kept in sync by triggers.
+SEARCH_TABLES = {
+  'Venue': ('venue_search', 'venue_genres', 'venue_id'),
+  'Artist': ('artist_search', 'artist_genres', 'artist_id'),
+}
+
+def sqlite_search_ddl(table, search_table, genre_table, genre_fk):
+  genres = "(SELECT group_concat(g.name, ' ') FROM genres g JOIN %s a ON a.genre_id = g.id WHERE a.%s = {id})" \
+    % (genre_table, genre_fk)
+  return [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5(name, city, genres, tokenize='trigram')" % search_table,
+    # Rank name matches above city matches above genre matches.
+    "INSERT INTO %s (%s, rank) VALUES ('rank', 'bm25(10.0, 2.0, 1.0)')" % (search_table, search_table),
+    'CREATE TRIGGER IF NOT EXISTS %s_ai AFTER INSERT ON "%s" BEGIN '
+    "INSERT INTO %s (rowid, name, city, genres) VALUES (new.id, new.name, new.city, ''); END"
+    % (search_table, table, search_table),
+    'CREATE TRIGGER IF NOT EXISTS %s_au AFTER UPDATE OF name, city ON "%s" BEGIN '
+    'UPDATE %s SET name = new.name, city = new.city WHERE rowid = new.id; END'
+    % (search_table, table, search_table),
+    'CREATE TRIGGER IF NOT EXISTS %s_ad AFTER DELETE ON "%s" BEGIN '
+    'DELETE FROM %s WHERE rowid = old.id; END'
+    % (search_table, table, search_table),
+    'CREATE TRIGGER IF NOT EXISTS %s_genres_ai AFTER INSERT ON %s BEGIN '
+    'UPDATE %s SET genres = %s WHERE rowid = new.%s; END'
+    % (search_table, genre_table, search_table, genres.format(id='new.' + genre_fk), genre_fk),
+    'CREATE TRIGGER IF NOT EXISTS %s_genres_ad AFTER DELETE ON %s BEGIN '
+    'UPDATE %s SET genres = %s WHERE rowid = old.%s; END'
+    % (search_table, genre_table, search_table, genres.format(id='old.' + genre_fk), genre_fk),
+  ]
+
+@event.listens_for(db.metadata, 'after_create')
+def create_search_index(target, connection, **kw):
+  if connection.dialect.name != 'sqlite':
+      return
+  for table, (search_table, genre_table, genre_fk) in SEARCH_TABLES.items():
+      for statement in sqlite_search_ddl(table, search_table, genre_table, genre_fk):
+          connection.execute(db.text(statement))
+
+@event.listens_for(db.metadata, 'before_drop')
+def drop_search_index(target, connection, **kw):
+  if connection.dialect.name != 'sqlite':
+      return
+  for search_table, _, _ in SEARCH_TABLES.values():
+      connection.execute(db.text('DROP TABLE IF EXISTS %s' % search_table))
+
+#----------------------------------------------------------------------------#
+# Page cache.
+#----------------------------------------------------------------------------#
+
+page_cache = PageCache(cache_from_config(app.config))
+
+def page_groups(instance):
+  # Cached page groups a new, changed or deleted row shows up in. Detail
+  # pages list their counterparts, so a venue change reaches every artist
+  # page ('artist_pages') and vice versa.
+  if isinstance(instance, Venue):
+      return ['venues', 'shows', 'artist_pages', 'venue:%s' % instance.id]
+  if isinstance(instance, Artist):
+      return ['artists', 'shows', 'venue_pages', 'artist:%s' % instance.id]
+  if isinstance(instance, Show):
+      # 'artists' for the show counts in /api/v1/artists
+      return ['venues', 'artists', 'shows', 'venue:%s' % instance.venue_id, 'artist:%s' % instance.artist_id]
+  if isinstance(instance, Genre):
+      return ['venues', 'artists', 'venue_pages', 'artist_pages']
+  return []
+
+# Rows written with bulk inserts bypass the session and only expire with
+# CACHE_TTL.
+page_cache.watch(db.session, page_groups)
+
+# A page missed within REPLICA_STICKY_SECONDS of its invalidation is read
+# from the primary, so a lagging replica cannot put the old rows back in the
+# cache for every client, the writer included.
+page_cache.render_fresh(app.config['REPLICA_STICKY_SECONDS'], replicas.use_primary)
+
+#----------------------------------------------------------------------------#
+# Queries.
+#----------------------------------------------------------------------------#
+
+@contextmanager
+def count_queries():
+  # Counts the statements sent to the database inside the block, e.g.
+  #   with count_queries() as counter:
+  #       venue_detail(1)
+  #   counter['queries']
+  counter = {'queries': 0}
+
+  def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+      counter['queries'] += 1
+
+  event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+  try:
+      yield counter
+  finally:
+      event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def venue_directory(genre=None):
+  # Every venue grouped by area with its number of upcoming shows, in one
+  # statement reading the stored counts. With `genre`, only venues of that
+  # genre are listed.
+  query = db.session.query(
+      Venue.city, Venue.state, Venue.id, Venue.name, Venue.upcoming_shows_count
+    )
+  if genre is not None:
+      query = query.join(venue_genres, db.and_(
+        venue_genres.c.venue_id == Venue.id, venue_genres.c.genre_id == genre_id(genre)))
+  rows = query.order_by(Venue.state, Venue.city, Venue.name, Venue.id).all()
+  data = []
+  for (city, state), venues in groupby(rows, key=lambda row: (row[0], row[1])):
+      data.append({
+        "city": city,
+        "state": state,
+        "venues": [{
+          "id": venue_id,
+          "name": name,
+          "num_upcoming_shows": num_upcoming_shows,
+        } for _, _, venue_id, name, num_upcoming_shows in venues]
+      })
+  return data
+
+
+GENRE_TABLES = {
+  'Venue': (venue_genres, 'venue_id'),
+  'Artist': (artist_genres, 'artist_id'),
+}
+
+def genre_list(model):
+  # The genre names of each Venue or Artist row separated by ';' (as
+  # import-listings reads them), as a correlated subquery labelled genres.
+  genre_table, owner_fk = GENRE_TABLES[model.__tablename__]
+  if db.session.get_bind().dialect.name == 'postgresql':
+      names = db.func.string_agg(Genre.name, ';')
+  else:
+      names = db.func.group_concat(Genre.name, ';')
+  return db.select(names)\
+    .join(genre_table, genre_table.c.genre_id == Genre.id)\
+    .where(genre_table.c[owner_fk] == model.id)\
+    .scalar_subquery().label('genres')
+
+
+def split_genres(genres):
+  return genres.split(';') if genres else []
+
+
+API_PAGE_SIZE = 50
+
+def listing_columns(model):
+  # The fields of a Venue or Artist listing by name: its columns and genres.
+  columns = dict((column.key, column) for column in model.__table__.columns)
+  columns['genres'] = genre_list(model)
+  return columns
+
+
+def listing_page(model, fields=None, genre=None, after=None, per_page=API_PAGE_SIZE):
+  # One page of venues or artists in id order, selecting only `fields` (all
+  # of listing_columns by default) so narrow requests read narrow rows.
+  # `after` is the `next` cursor of the previous page; a malformed one
+  # raises ValueError.
+  columns = listing_columns(model)
+  fields = list(fields or columns)
+  query = db.session.query(model.id.label('cursor'), *[columns[field] for field in fields])
+  if genre is not None:
+      genre_table, owner_fk = GENRE_TABLES[model.__tablename__]
+      query = query.join(genre_table, db.and_(
+        genre_table.c[owner_fk] == model.id, genre_table.c.genre_id == genre_id(genre)))
+  if after is not None:
+      query = query.filter(model.id > int(after))
+  rows = query.order_by(model.id).limit(per_page + 1).all()
+  data = []
+  for row in rows[:per_page]:
+      item = dict(zip(fields, row[1:]))
+      if 'genres' in item:
+          item['genres'] = split_genres(item['genres'])
+      data.append(item)
+  next_cursor = None
+  if len(rows) > per_page:
+      next_cursor = str(rows[per_page - 1][0])
+  return {"data": data, "next": next_cursor}
+
+
+SEARCH_RESULTS_PER_PAGE = 20
+
+def ranked_search(model, search_term):
+  # Subquery of (id, rank) for every Venue or Artist whose name, city or
+  # genres contain search_term, best matches first when ordered by rank desc.
+  search_table, _, genre_fk = SEARCH_TABLES[model.__tablename__]
+  dialect = db.session.get_bind().dialect.name
+  if dialect == 'sqlite' and len(search_term) >= 3:
+      # The trigram tokenizer needs at least three characters to match;
+      # shorter terms use the plain LIKE scan below.
+      return db.text(
+          'SELECT rowid AS id, -rank AS rank FROM %s WHERE %s MATCH :query'
+          % (search_table, search_table)
+        ).bindparams(query='"%s"' % search_term.replace('"', '""'))\
+        .columns(id=db.Integer, rank=db.Float).alias('ranked')
+  like = '%' + search_term + '%'
+  name_match = model.name.ilike(like)
+  rank = db.cast(name_match, db.Integer)
+  if dialect == 'postgresql':
+      rank = rank + db.func.similarity(model.name, search_term)
+  genre_table = venue_genres if model is Venue else artist_genres
+  genre_matches = db.session.query(genre_table.c[genre_fk])\
+    .join(Genre, Genre.id == genre_table.c.genre_id)\
+    .filter(Genre.name.ilike(like))
+  return db.session.query(model.id.label('id'), rank.label('rank'))\
+    .filter(db.or_(name_match, model.city.ilike(like), model.id.in_(genre_matches)))\
+    .subquery('ranked')
+
+
+def search_with_upcoming_shows(model, search_term, page=1, per_page=SEARCH_RESULTS_PER_PAGE):
+  # Ranked search over Venue or Artist. Each page of matches comes back with
+  # its stored upcoming-show counts from one query, plus one COUNT for the
+  # total, however many rows match.
+  page = max(page, 1)
+  ranked = ranked_search(model, search_term)
+  count = db.session.query(db.func.count()).select_from(ranked).scalar()
+  rows = db.session.query(model.id, model.name, model.upcoming_shows_count)\
+    .join(ranked, ranked.c.id == model.id)\
+    .order_by(ranked.c.rank.desc(), model.name, model.id)\
+    .limit(per_page).offset((page - 1) * per_page).all()
+  return {
+    "count": count,
+    "page": page,
+    "pages": (count + per_page - 1) // per_page,
+    "data": [{
+      "id": id,
+      "name": name,
+      "num_upcoming_shows": num_upcoming_shows,
+    } for id, name, num_upcoming_shows in rows]
+  }
+
+def show_items(rows, prefix):
+  # (start_time, id, name, image_link) rows of the counterpart artist or
+  # venue as the show dicts the detail templates render.
+  return [{
+    prefix + "_id": id,
+    prefix + "_name": name,
+    prefix + "_image_link": image_link,
+    "start_time": start_time
+  } for start_time, id, name, image_link in rows]
+
+
+def partition_shows(rows, prefix, now):
+  # Splits show rows (see show_items) into past and upcoming show lists
+  # against a single `now`.
+  past_shows = []
+  upcoming_shows = []
+  for show_item in show_items(rows, prefix):
+      if show_item["start_time"] > now:
+          upcoming_shows.append(show_item)
+      else:
+          past_shows.append(show_item)
+  return past_shows, upcoming_shows
+
+
+def venue_page(venue, genres, past_shows, upcoming_shows):
+  return {
+    "id": venue.id,
+    "name": venue.name,
+    "genres": genres,
+    "address": venue.address,
+    "city": venue.city,
+    "state": venue.state,
+    "phone": venue.phone,
+    "website": '',
+    "facebook_link": venue.facebook_link,
+    "seeking_talent": True,
+    "seeking_description": "We are on the lookout for a local artist to play every two weeks. Please call us.",
+    "image_link": venue.image_link,
+    "past_shows": past_shows,
+    "upcoming_shows": upcoming_shows,
+    "past_shows_count": len(past_shows),
+    "upcoming_shows_count": len(upcoming_shows),
+  }
+
+
+def artist_page(artist, genres, past_shows, upcoming_shows):
+  return {
+    "id": artist.id,
+    "name": artist.name,
+    "genres": genres,
+    "city": artist.city,
+    "state": artist.state,
+    "phone": artist.phone,
+    "website": '',
+    "facebook_link": artist.facebook_link,
+    "seeking_venue": True,
+    "seeking_description": "Looking for shows to perform at in the San Francisco Bay Area!",
+    "image_link": artist.image_link,
+    "past_shows": past_shows,
+    "upcoming_shows": upcoming_shows,
+    "past_shows_count": len(past_shows),
+    "upcoming_shows_count": len(upcoming_shows),
+  }
+
+
+def venue_detail(venue_id, now=None):
+  # Everything show_venue renders in two statements: the venue with its
+  # genres, then all of its shows joined to their artists. Returns None for
+  # an unknown venue.
+  if now is None:
+      now = datetime.now()
+  venue = Venue.query.options(db.joinedload(Venue.genres))\
+    .filter(Venue.id == venue_id).one_or_none()
+  if venue is None:
+      return None
+  rows = db.session.query(Show.start_time, Artist.id, Artist.name, Artist.image_link)\
+    .join(Artist, Show.artist_id == Artist.id)\
+    .filter(Show.venue_id == venue_id)\
+    .order_by(Show.start_time).all()
+  past_shows, upcoming_shows = partition_shows(rows, "artist", now)
+  return venue_page(venue, [genre.name for genre in venue.genres], past_shows, upcoming_shows)
+
+
+def artist_detail(artist_id, now=None):
+  # Everything show_artist renders in two statements, see venue_detail.
+  if now is None:
+      now = datetime.now()
+  artist = Artist.query.options(db.joinedload(Artist.genres))\
+    .filter(Artist.id == artist_id).one_or_none()
+  if artist is None:
+      return None
+  rows = db.session.query(Show.start_time, Venue.id, Venue.name, Venue.image_link)\
+    .join(Venue, Show.venue_id == Venue.id)\
+    .filter(Show.artist_id == artist_id)\
+    .order_by(Show.start_time).all()
+  past_shows, upcoming_shows = partition_shows(rows, "venue", now)
+  return artist_page(artist, [genre.name for genre in artist.genres], past_shows, upcoming_shows)
+
+
+def detail_statements(model, model_id, genre_table, genre_fk, counterpart, show_fk, counterpart_fk, now):
+  # The four independent statements of a detail page: the row, its genres,
+  # its past shows and its upcoming shows.
+  shows = db.select(Show.start_time, counterpart.id, counterpart.name, counterpart.image_link)\
+    .join(counterpart, counterpart_fk == counterpart.id)\
+    .where(show_fk == model_id)\
+    .order_by(Show.start_time)
+  return [
+    db.select(model.__table__).where(model.id == model_id),
+    db.select(Genre.name).join(genre_table, genre_table.c.genre_id == Genre.id)\
+      .where(genre_table.c[genre_fk] == model_id).order_by(Genre.name),
+    shows.where(Show.start_time <= now),
+    shows.where(Show.start_time > now),
+  ]
+
+
+async def venue_detail_async(venue_id, now=None):
+  # venue_detail with its statements sent concurrently through async_db.
+  if now is None:
+      now = datetime.now()
+  venues, genres, past, upcoming = await async_db.fetch_all(*detail_statements(
+    Venue, venue_id, venue_genres, 'venue_id', Artist, Show.venue_id, Show.artist_id, now))
+  if not venues:
+      return None
+  return venue_page(venues[0], [genre.name for genre in genres],
+                    show_items(past, "artist"), show_items(upcoming, "artist"))
+
+
+async def artist_detail_async(artist_id, now=None):
+  # artist_detail with its statements sent concurrently, see venue_detail_async.
+  if now is None:
+      now = datetime.now()
+  artists, genres, past, upcoming = await async_db.fetch_all(*detail_statements(
+    Artist, artist_id, artist_genres, 'artist_id', Venue, Show.artist_id, Show.venue_id, now))
+  if not artists:
+      return None
+  return artist_page(artists[0], [genre.name for genre in genres],
+                     show_items(past, "venue"), show_items(upcoming, "venue"))
+
+SHOWS_PER_PAGE = 30
+
+def show_cursor(start_time, show_id):
+  return '%s_%d' % (start_time.isoformat(), show_id)
+
+def parse_show_cursor(cursor):
+  # Inverse of show_cursor; raises ValueError on a malformed cursor.
+  start_time, show_id = cursor.rsplit('_', 1)
+  return datetime.fromisoformat(start_time), int(show_id)
+
+
+def show_listing(when='all', after=None, per_page=SHOWS_PER_PAGE, now=None):
+  # One page of /shows using keyset pagination on (start_time, id), so a
+  # page costs the same however deep it is. Upcoming shows run soonest
+  # first, past and all shows latest first. `after` is the `next` cursor
+  # of the previous page.
+  if now is None:
+      now = datetime.now()
+  key = db.tuple_(Show.start_time, Show.id)
+  query = db.session.query(
+      Show.id, Show.start_time, Venue.id, Venue.name,
+      Artist.id, Artist.name, Artist.image_link
+    ).join(Venue, Show.venue_id == Venue.id)\
+    .join(Artist, Show.artist_id == Artist.id)
+  if when == 'upcoming':
+      query = query.filter(Show.start_time > now)
+  elif when == 'past':
+      query = query.filter(Show.start_time <= now)
+  ascending = when == 'upcoming'
+  if after is not None:
+      position = parse_show_cursor(after)
+      query = query.filter(key > position if ascending else key < position)
+  if ascending:
+      query = query.order_by(Show.start_time, Show.id)
+  else:
+      query = query.order_by(Show.start_time.desc(), Show.id.desc())
+  rows = query.limit(per_page + 1).all()
+  data = [{
+    "id": show_id,
+    "venue_id": venue_id,
+    "venue_name": venue_name,
+    "artist_id": artist_id,
+    "artist_name": artist_name,
+    "artist_image_link": artist_image_link,
+    "start_time": start_time
+  } for show_id, start_time, venue_id, venue_name, artist_id, artist_name, artist_image_link in rows[:per_page]]
+  next_cursor = None
+  if len(rows) > per_page:
+      last = rows[per_page - 1]
+      next_cursor = show_cursor(last[1], last[0])
+  return {"shows": data, "next": next_cursor}
+
+
+def calendar_listing(city, state=None, start=None, end=None, after=None, per_page=SHOWS_PER_PAGE):
+  # One page of the shows in `city` (and `state`) from the `start` date to
+  # the `end` date inclusive, soonest first, read from show_calendar with
+  # the same keyset cursor as show_listing.
+  calendar = show_calendar.c
+  query = db.session.query(
+      calendar.show_id, calendar.start_time, calendar.venue_id, calendar.venue_name,
+      calendar.artist_id, calendar.artist_name, calendar.artist_image_link
+    ).filter(calendar.city == city)
+  if state:
+      query = query.filter(calendar.state == state)
+  if start is not None:
+      query = query.filter(calendar.start_date >= start)
+  if end is not None:
+      query = query.filter(calendar.start_date <= end)
+  if after is not None:
+      start_time, show_id = parse_show_cursor(after)
+      query = query.filter(db.tuple_(calendar.start_date, calendar.start_time, calendar.show_id)
+                           > (start_time.date(), start_time, show_id))
+  rows = query.order_by(calendar.start_date, calendar.start_time, calendar.show_id)\
+    .limit(per_page + 1).all()
+  data = [{
+    "id": show_id,
+    "venue_id": venue_id,
+    "venue_name": venue_name,
+    "artist_id": artist_id,
+    "artist_name": artist_name,
+    "artist_image_link": artist_image_link,
+    "start_time": start_time
+  } for show_id, start_time, venue_id, venue_name, artist_id, artist_name, artist_image_link in rows[:per_page]]
+  next_cursor = None
+  if len(rows) > per_page:
+      last = rows[per_page - 1]
+      next_cursor = show_cursor(last[1], last[0])
+  return {"shows": data, "next": next_cursor}
+
+#----------------------------------------------------------------------------#
+# Export.
+#----------------------------------------------------------------------------#
+
+# Full dumps of venues, artists and shows for partners, served from
+# /export/<kind>.<format> and written by the export-listings command. Rows
+# are read with yield_per, through a server-side cursor on PostgreSQL, and
+# written out one batch at a time, so memory stays flat however large the
+# tables get.
+
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_FORMATS = {
+  'csv': 'text/csv',
+  'jsonl': 'application/x-ndjson',
+}
+
+EXPORT_TABLES = {
+  'venues': Venue,
+  'artists': Artist,
+  'shows': Show,
+}
+
+def export_query(kind):
+  # Every column of kind in id order, plus the genres of venues and artists.
+  model = EXPORT_TABLES[kind]
+  columns = list(model.__table__.columns)
+  if model is not Show:
+      columns.append(genre_list(model))
+  return db.session.query(*columns).order_by(model.id)
+
+
+def export_chunks(kind, format, batch_size=EXPORT_BATCH_SIZE):
+  # Yields the export as text, one chunk per batch_size rows.
+  query = export_query(kind).yield_per(batch_size)
+  names = [column['name'] for column in query.column_descriptions]
+  buffer = io.StringIO()
+  writer = csv.writer(buffer)
+  if format == 'csv':
+      writer.writerow(names)
+  for count, row in enumerate(query, 1):
+      if format == 'csv':
+          writer.writerow(row)
+      else:
+          record = dict(zip(names, row))
+          if 'genres' in record:
+              record['genres'] = split_genres(record['genres'])
+          buffer.write(json.dumps(record, default=str) + '\n')
+      if count % batch_size == 0:
+          yield buffer.getvalue()
+          buffer.seek(0)
+          buffer.truncate()
+  if buffer.tell():
+      yield buffer.getvalue()
+
+
+def gzip_chunks(chunks):
+  # Compresses text chunks into a gzip stream as they come.
+  compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+  for chunk in chunks:
+      data = compressor.compress(chunk.encode('utf-8'))
+      if data:
+          yield data
+  yield compressor.flush()
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format)
+DATETIME_FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma",
+}
+
+# (format, locale) -> (compiled babel pattern, babel Locale), so each row of
+# a listing skips re-parsing both
+datetime_patterns = {}
+
+def format_datetime(value, format='medium', locale=None):
+  # Accepts datetime objects as they come from the database; strings are
+  # still parsed for callers that pass them.
+  if isinstance(value, str):
+      value = dateutil.parser.parse(value)
+  if format in ('long', 'short'):
+      return babel.dates.format_datetime(value, format, locale=locale or babel.dates.LC_TIME)
+  key = (format, locale)
+  if key not in datetime_patterns:
+      datetime_patterns[key] = (
+        babel.dates.parse_pattern(DATETIME_FORMATS.get(format, format)),
+        babel.Locale.parse(locale or babel.dates.LC_TIME),
+      )
+  pattern, babel_locale = datetime_patterns[key]
+  return pattern.apply(value, babel_locale)
 
 app.jinja_env.filters['datetime'] = format_datetime
 
@@ -104,109 +931,31 @@ def index():
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@page_cache.cached(lambda: ['venues'])
 def venues():
-  # TODO: replace with real venues data.
-  #       num_shows should be aggregated based on number of upcoming shows per venue.
-  data = []
-  city_state = db.session.query(Venue.city, Venue.state).group_by(Venue.city, Venue.state).all()
-  for value in city_state:
-      venues = Venue.query.filter_by(city=value[0]).filter_by(state=value[1]).all()
-      venues_data = []
-      for venue in venues:
-          venues_data.append({
-            "id": venue.id,
-            "name": venue.name,
-            "num_upcoming_shows": len(venue.shows),
-          })
-      data.append({
-        "city": value[0],
-        "state": value[1],
-        "venues": venues_data
-      })
-  return render_template('pages/venues.html', areas=data);
+  genre = request.args.get('genre')
+  data = venue_directory(genre=genre)
+  return render_template('pages/venues.html', areas=data, genre=genre);
 
 
 @app.route('/venues/search', methods=['POST'])
+@read_only
 def search_venues():
-  # TODO: implement search on venues with partial string search. Ensure it is case-insensitive.
-  venues = Venue.query.filter(Venue.name.ilike('%'+request.form.get('search_term', '')+'%')).all()
-  count_venues = len(venues)
-  data = []
-  for venue in venues:
-      num_upcoming_shows =  Show.query.join(Venue, Show.venue_id==venue.id).filter(Show.start_time>datetime.now()).count()
-      venue_item = {
-        "id": venue.id,
-        "name": venue.name,
-        "num_upcoming_shows": num_upcoming_shows,
-      }
-      data.append(venue_item)
-  # seach for Hop should return "The Musical Hop".
-  # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
-  response={
-    "count": count_venues,
-    "data": data
-  }
-  return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
+  search_term = request.form.get('search_term', '')
+  response = search_with_upcoming_shows(Venue, search_term, request.form.get('page', 1, type=int))
+  return render_template('pages/search_venues.html', results=response, search_term=search_term)
 
 
 @app.route('/venues/<int:venue_id>')
+@page_cache.cached(lambda venue_id: ['venue_pages', 'venue:%d' % venue_id])
 def show_venue(venue_id):
   # shows the venue page with the given venue_id
-  # TODO: replace with real venue data from the venues table, using venue_id
-  venue = Venue.query.get(venue_id)
-  data = []
-  # for artist in artists:
-  genres = []
-  if venue.genres is not None:
-      for genre in venue.genres:
-          genres.append(genre.name)
-  past_shows = []
-  finished_shows = Show.query.join(Venue, Show.venue_id==Venue.id)\
-    .filter(Venue.id==venue_id).filter(Show.start_time<=datetime.now()).all()
-  if finished_shows is not None:
-      for show in finished_shows:
-          artist_Obj = {
-          "artist_id": show.artist.id,
-          "artist_name": show.artist.name,
-          "artist_image_link": show.artist.image_link,
-          "start_time": str(show.start_time)
-          }
-          past_shows.append(artist_Obj)
-  upcoming_shows =[]
-  past_shows_count = Show.query.join(Venue, Show.venue_id==Venue.id)\
-    .filter(Venue.id==venue_id).filter(Show.start_time<=datetime.now()).count()
-  upcoming_shows_count = Show.query.join(Venue, Show.venue_id==Venue.id)\
-    .filter(Venue.id==venue_id).filter(Show.start_time>datetime.now()).count()
-  comming_shows = Show.query.join(Venue, Show.venue_id==Venue.id)\
-    .filter(Venue.id==venue_id).filter(Show.start_time>datetime.now()).all()
-  if comming_shows is not None:
-      for show in comming_shows:
-          show_item = {
-          "artist_id": show.artist.id,
-          "artist_name": show.artist.name,
-          "artist_image_link": show.artist.image_link,
-          "start_time": str(show.start_time)
-          }
-          upcoming_shows.append(show_item)
-  obj ={
-  'id': venue.id,
-  "name": venue.name,
-  "genres": genres,
-  "address": venue.address,
-  "city": venue.city,
-  "state": venue.state,
-  "phone": venue.phone,
-  "website": '',
-  "facebook_link": venue.facebook_link,
-  "seeking_talent": True,
-  "seeking_description": "We are on the lookout for a local artist to play every two weeks. Please call us.",
-  "image_link": venue.image_link,
-  "past_shows": past_shows,
-  "upcoming_shows": upcoming_shows,
-  "past_shows_count": past_shows_count,
-  "upcoming_shows_count": upcoming_shows_count,
-  }
-  # data = list(filter(lambda d: d['id'] == venue_id, [data1, data2, data3]))[0]
+  if async_db.enabled:
+      obj = async_db.run(venue_detail_async(venue_id))
+  else:
+      obj = venue_detail(venue_id)
+  if obj is None:
+      abort(404)
   return render_template('pages/show_venue.html', venue=obj)
 
 
@@ -242,17 +991,13 @@ def create_venue_submission():
         venue.phone = body['phone']
         venue.image_link = body['image_link']
         venue.facebook_link = body['facebook_link']
-        for item in body['genres']:
-            genre = Genre(name=item)
-            genre.venues = venue
+        venue.genres = genres_named(body['genres'])
         db.session.add(venue)
         db.session.commit()
   # TODO: modify data to be the data object returned from db insertion
     except:
         db.session.rollback()
         error = True
-    finally:
-        db.session.close()
   # on successful db insert, flash success
   # flash('Venue ' + request.form['name'] + ' was successfully listed!')
   # TODO: on unsuccessful db insert, flash an error instead.
@@ -278,89 +1023,35 @@ def delete_venue(venue_id):
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@page_cache.cached(lambda: ['artists'])
 def artists():
-  return render_template('pages/artists.html', artists=Artist.query.all())
+  genre = request.args.get('genre')
+  query = db.session.query(Artist.id, Artist.name)
+  if genre is not None:
+      query = query.join(artist_genres, db.and_(
+        artist_genres.c.artist_id == Artist.id, artist_genres.c.genre_id == genre_id(genre)))
+  data = [{"id": id, "name": name} for id, name in query.order_by(Artist.name, Artist.id).all()]
+  return render_template('pages/artists.html', artists=data, genre=genre)
 
 
 @app.route('/artists/search', methods=['POST'])
+@read_only
 def search_artists():
-  # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
-  artists = Artist.query.filter(Artist.name.ilike('%'+request.form.get('search_term', '')+'%')).all()
-  count_artists = len(artists)
-  data = []
-  for artist in artists:
-      num_upcoming_shows =  Show.query.join(Artist, Show.artist_id==artist.id).filter(Show.start_time>datetime.now()).count()
-      artist_item = {
-        "id": artist.id,
-        "name": artist.name,
-        "num_upcoming_shows": num_upcoming_shows,
-      }
-      data.append(artist_item)
-  # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
-  # search for "band" should return "The Wild Sax Band".
-  response={
-    "count": count_artists,
-    "data": data
-  }
-  return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
+  search_term = request.form.get('search_term', '')
+  response = search_with_upcoming_shows(Artist, search_term, request.form.get('page', 1, type=int))
+  return render_template('pages/search_artists.html', results=response, search_term=search_term)
 
 
 @app.route('/artists/<int:artist_id>')
+@page_cache.cached(lambda artist_id: ['artist_pages', 'artist:%d' % artist_id])
 def show_artist(artist_id):
-  # shows the venue page with the given venue_id
-  # TODO: replace with real venue data from the venues table, using venue_id
-  artist = Artist.query.get(artist_id)
-  data = []
-  # for artist in artists:
-  genres = []
-  if artist.genres is not None:
-      for genre in artist.genres:
-          genres.append(genre.name)
-  past_shows = []
-  finished_shows = Show.query.join(Artist, Show.artist_id==Artist.id)\
-    .filter(Artist.id==artist_id).filter(Show.start_time<=datetime.now()).all()
-  if finished_shows is not None:
-      for show in finished_shows:
-          venue_Obj = {
-          "venue_id": show.venue.id,
-          "venue_name": show.venue.name,
-          "venue_image_link": show.venue.image_link,
-          "start_time": str(show.start_time)
-          }
-          past_shows.append(venue_Obj)
-  upcoming_shows =[]
-  past_shows_count = Show.query.join(Artist, Show.artist_id==Artist.id)\
-    .filter(Artist.id==artist_id).filter(Show.start_time<=datetime.now()).count()
-  upcoming_shows_count = Show.query.join(Artist, Show.artist_id==Artist.id)\
-    .filter(Artist.id==artist_id).filter(Show.start_time>datetime.now()).count()
-  comming_shows = Show.query.join(Artist, Show.artist_id==Artist.id)\
-    .filter(Artist.id==artist_id).filter(Show.start_time>datetime.now()).all()
-  if comming_shows is not None:
-      for show in comming_shows:
-          show_item = {
-          "venue_id": show.venue.id,
-          "venue_name": show.venue.name,
-          "venue_image_link": show.venue.image_link,
-          "start_time": str(show.start_time)
-          }
-          upcoming_shows.append(show_item)
-  obj ={
-  'id': artist.id,
-  "name": artist.name,
-  "genres": genres,
-  "city": artist.city,
-  "state": artist.state,
-  "phone": artist.phone,
-  "website": '',
-  "facebook_link": artist.facebook_link,
-  "seeking_venue": True,
-  "seeking_description": "Looking for shows to perform at in the San Francisco Bay Area!",
-  "image_link": artist.image_link,
-  "past_shows": past_shows,
-  "upcoming_shows": upcoming_shows,
-  "past_shows_count": past_shows_count,
-  "upcoming_shows_count": upcoming_shows_count,
-  }
+  # shows the artist page with the given artist_id
+  if async_db.enabled:
+      obj = async_db.run(artist_detail_async(artist_id))
+  else:
+      obj = artist_detail(artist_id)
+  if obj is None:
+      abort(404)
   return render_template('pages/show_artist.html', artist=obj)
 
 
@@ -455,17 +1146,13 @@ def create_artist_submission():
         artist.phone = body['phone']
         artist.image_link = body['image_link']
         artist.facebook_link = body['facebook_link']
-        for item in body['genres']:
-            genre = Genre(name=item)
-            genre.artists = artist
+        artist.genres = genres_named(body['genres'])
         db.session.add(artist)
         db.session.commit()
   # TODO: modify data to be the data object returned from db insertion
     except:
         db.session.rollback()
         error = True
-    finally:
-        db.session.close()
   # on successful db insert, flash success
   # flash('Artist ' + request.form['name'] + ' was successfully listed!')
   # TODO: on unsuccessful db insert, flash an error instead.
@@ -480,26 +1167,34 @@ def create_artist_submission():
 #  Shows
 #  ----------------------------------------------------------------
 
+def show_page(args):
+  # The /shows listing for the request `args` and the filters its pager
+  # links carry: ?when=all|upcoming|past paged with the ?after=<cursor> of
+  # the previous page, or ?city=&state=&from=&to= (YYYY-MM-DD, from defaults
+  # to today) for a city's shows between two dates. Raises ValueError on
+  # bad arguments.
+  city = args.get('city')
+  if city:
+      filters = dict((key, args[key]) for key in ('city', 'state', 'from', 'to') if args.get(key))
+      start = datetime.strptime(filters['from'], '%Y-%m-%d').date() if 'from' in filters else datetime.now().date()
+      end = datetime.strptime(filters['to'], '%Y-%m-%d').date() if 'to' in filters else None
+      return calendar_listing(city, filters.get('state'), start, end, args.get('after')), filters
+  when = args.get('when', 'all')
+  if when not in ('all', 'upcoming', 'past'):
+      raise ValueError('when must be all, upcoming or past')
+  return show_listing(when, args.get('after')), {'when': when}
+
+
 @app.route('/shows')
+@page_cache.cached(lambda: ['shows'])
 def shows():
-  # displays list of shows at /shows
-  # TODO: replace with real venues data.
-  #       num_shows should be aggregated based on number of upcoming shows per venue.
-  upcoming_shows = Show.query.order_by(Show.start_time.desc()).all()
-  # upcoming_shows = Show.query.filter(Show.start_time>datetime.now()).all()
-  data = []
-  for show in upcoming_shows:
-      data.append({
-        "venue_id": show.venue.id,
-        "venue_name": show.venue.name,
-        "artist_id": show.artist.id,
-        "artist_name": show.artist.name,
-        "artist_image_link": show.artist.image_link,
-        "start_time": str(show.start_time)
-      })
-  print(data)
-  print(upcoming_shows)
-  return render_template('pages/shows.html', shows=data)
+  # displays list of shows at /shows, see show_page for the filters
+  try:
+      listing, filters = show_page(request.args)
+  except ValueError:
+      abort(400)
+  return render_template('pages/shows.html', shows=listing['shows'], next_cursor=listing['next'],
+                         when=filters.get('when'), filters=filters)
 
 
 @app.route('/shows/create')
@@ -521,16 +1216,15 @@ def create_show_submission():
   }
   try:
       show = Show()
-      show.artist_id = body['artist_id']
-      show.venue_id = body['venue_id']
-      show.start_time = body['start_time']
+      show.artist_id = int(body['artist_id'])
+      show.venue_id = int(body['venue_id'])
+      # the form posts text; the DateTime column takes a datetime
+      show.start_time = dateutil.parser.parse(body['start_time'])
       db.session.add(show)
       db.session.commit()
   except:
       db.session.rollback()
       error = True
-  finally:
-      db.session.close()
   # on successful db insert, flash success
   if error:
       flash('An error occurred. Show could not be listed.')
@@ -542,6 +1236,173 @@ def create_show_submission():
   return render_template('pages/home.html')
 
 
+#  API
+#  ----------------------------------------------------------------
+
+# JSON versions of the listing and detail pages for mobile clients, built
+# from the same query functions. ?fields=a,b returns only those fields, and
+# list endpoints page with the `next` cursor of the previous page in
+# ?after=. Bodies are cached with the pages they mirror and carry an ETag;
+# a matching If-None-Match gets an empty 304.
+
+def api_error(status, message):
+  return jsonify({"error": message}), status
+
+
+def api_fields(available):
+  # The fields named in ?fields=, or None for all of them. Raises ValueError
+  # for a field not in `available`.
+  if not request.args.get('fields'):
+      return None
+  fields = list(dict.fromkeys(field.strip() for field in request.args['fields'].split(',') if field.strip()))
+  unknown = [field for field in fields if field not in available]
+  if unknown:
+      raise ValueError('unknown fields: %s' % ', '.join(unknown))
+  return fields
+
+
+def pick(item, fields):
+  return item if fields is None else dict((field, item[field]) for field in fields)
+
+
+def api_body(data):
+  return json.dumps(data, default=lambda value: value.isoformat())
+
+
+def conditional_json(view):
+  # Serves the JSON text a view returns with an ETag of the body, answering
+  # a matching If-None-Match with 304. Error responses pass through.
+  @wraps(view)
+  def wrapper(**kwargs):
+      body = view(**kwargs)
+      if not isinstance(body, str):
+          return body
+      response = Response(body, mimetype='application/json')
+      response.add_etag()
+      response.cache_control.no_cache = True
+      return response.make_conditional(request)
+  return wrapper
+
+
+@app.route('/api/v1/venues')
+@conditional_json
+@page_cache.cached(lambda: ['venues'])
+def api_venues():
+  try:
+      fields = api_fields(listing_columns(Venue))
+      listing = listing_page(Venue, fields, request.args.get('genre'), request.args.get('after'))
+  except ValueError as e:
+      return api_error(400, str(e))
+  return api_body(listing)
+
+
+@app.route('/api/v1/venues/<int:venue_id>')
+@conditional_json
+@page_cache.cached(lambda venue_id: ['venue_pages', 'venue:%d' % venue_id])
+def api_venue(venue_id):
+  venue = venue_detail(venue_id)
+  if venue is None:
+      return api_error(404, 'venue %d not found' % venue_id)
+  try:
+      return api_body(pick(venue, api_fields(venue)))
+  except ValueError as e:
+      return api_error(400, str(e))
+
+
+@app.route('/api/v1/artists')
+@conditional_json
+@page_cache.cached(lambda: ['artists'])
+def api_artists():
+  try:
+      fields = api_fields(listing_columns(Artist))
+      listing = listing_page(Artist, fields, request.args.get('genre'), request.args.get('after'))
+  except ValueError as e:
+      return api_error(400, str(e))
+  return api_body(listing)
+
+
+@app.route('/api/v1/artists/<int:artist_id>')
+@conditional_json
+@page_cache.cached(lambda artist_id: ['artist_pages', 'artist:%d' % artist_id])
+def api_artist(artist_id):
+  artist = artist_detail(artist_id)
+  if artist is None:
+      return api_error(404, 'artist %d not found' % artist_id)
+  try:
+      return api_body(pick(artist, api_fields(artist)))
+  except ValueError as e:
+      return api_error(400, str(e))
+
+
+SHOW_FIELDS = ('id', 'venue_id', 'venue_name', 'artist_id', 'artist_name', 'artist_image_link', 'start_time')
+
+@app.route('/api/v1/shows')
+@conditional_json
+@page_cache.cached(lambda: ['shows'])
+def api_shows():
+  # the /shows listing and filters, see show_page
+  try:
+      fields = api_fields(SHOW_FIELDS)
+      listing, _ = show_page(request.args)
+  except ValueError as e:
+      return api_error(400, str(e))
+  return api_body({"data": [pick(show, fields) for show in listing['shows']], "next": listing['next']})
+
+
+#  Export
+#  ----------------------------------------------------------------
+
+@app.route('/export/<any(venues, artists, shows):kind>.<any(csv, jsonl):format>', defaults={'compress': False})
+@app.route('/export/<any(venues, artists, shows):kind>.<any(csv, jsonl):format>.gz', defaults={'compress': True})
+def export_listings_file(kind, format, compress):
+  # Streams the whole table; .gz downloads a gzip file, and clients that
+  # accept gzip get the plain file compressed in transit.
+  chunks = export_chunks(kind, format)
+  filename = '%s.%s' % (kind, format)
+  mimetype = EXPORT_FORMATS[format]
+  headers = {'Vary': 'Accept-Encoding'}
+  if compress:
+      filename += '.gz'
+      mimetype = 'application/gzip'
+      chunks = gzip_chunks(chunks)
+  elif 'gzip' in request.accept_encodings:
+      headers['Content-Encoding'] = 'gzip'
+      chunks = gzip_chunks(chunks)
+  headers['Content-Disposition'] = 'attachment; filename=%s' % filename
+  return Response(stream_with_context(chunks), mimetype=mimetype, headers=headers)
+
+
+#  Monitoring
+#  ----------------------------------------------------------------
+
+def internal_only(view):
+  # The monitoring endpoints answer in debug mode, and otherwise only to
+  # requests sending INTERNAL_TOKEN in X-Internal-Token; anyone else gets a
+  # 404, as if they did not exist.
+  @wraps(view)
+  def wrapper(**kwargs):
+      token = app.config.get('INTERNAL_TOKEN')
+      sent = request.headers.get('X-Internal-Token', '')
+      if not app.debug and not (token and hmac.compare_digest(sent.encode('utf-8'), token.encode('utf-8'))):
+          abort(404)
+      return view(**kwargs)
+  return wrapper
+
+
+@app.route('/internal/cache')
+@internal_only
+def cache_stats():
+  return jsonify(page_cache.stats())
+
+
+@app.route('/internal/pool')
+@internal_only
+def pool_stats():
+  status = pool_status(db.engine.pool)
+  status['replicas'] = replicas.status(pool_status)
+  return jsonify(status)
+
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -551,6 +1412,299 @@ def server_error(error):
     return render_template('errors/500.html'), 500
 
 
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+IMPORT_FORMS = {
+  'venues': VenueForm,
+  'artists': ArtistForm,
+  'shows': ShowForm,
+}
+
+def read_import_rows(stream, format):
+  # Yields (line_number, row, error) for each record of a CSV or JSON-lines
+  # stream, one line at a time. CSV genres are separated by ';'.
+  if format == 'csv':
+      reader = csv.DictReader(stream)
+      for row in reader:
+          if row.get('genres'):
+              row['genres'] = [genre.strip() for genre in row['genres'].split(';') if genre.strip()]
+          yield reader.line_num, row, None
+  else:
+      for line_number, line in enumerate(stream, 1):
+          if not line.strip():
+              continue
+          try:
+              yield line_number, json.loads(line), None
+          except ValueError as e:
+              yield line_number, None, str(e)
+
+
+def validate_import_row(form_class, row):
+  # Runs a row through the same form the create pages use; returns
+  # (form data, None) or (None, errors).
+  formdata = MultiDict()
+  for key, value in row.items():
+      for item in (value if isinstance(value, list) else [value]):
+          if item is not None:
+              formdata.add(key, str(item))
+  form = form_class(formdata=formdata, meta={'csrf': False})
+  if form.validate():
+      return form.data, None
+  return None, form.errors
+
+
+def import_batch(kind, batch):
+  # Inserts one batch of validated (line_number, data) pairs in a single
+  # transaction and returns the rejected ones as (line_number, error).
+  rejected = []
+  if kind == 'shows':
+      # the form takes the ids as text; a non-numeric one rejects its row
+      # here rather than failing the whole batch's IN () on PostgreSQL
+      shows = []
+      for line_number, data in batch:
+          try:
+              shows.append((line_number, int(data['venue_id']), int(data['artist_id']), data['start_time']))
+          except (TypeError, ValueError):
+              rejected.append((line_number, 'venue_id and artist_id must be integers'))
+      venue_ids = set(venue_id for _, venue_id, _, _ in shows)
+      artist_ids = set(artist_id for _, _, artist_id, _ in shows)
+      venue_ids = set(id for (id,) in db.session.query(Venue.id).filter(Venue.id.in_(venue_ids)))
+      artist_ids = set(id for (id,) in db.session.query(Artist.id).filter(Artist.id.in_(artist_ids)))
+      rows = []
+      for line_number, venue_id, artist_id, start_time in shows:
+          if venue_id not in venue_ids or artist_id not in artist_ids:
+              rejected.append((line_number, 'unknown venue_id or artist_id'))
+          else:
+              rows.append({'venue_id': venue_id, 'artist_id': artist_id, 'start_time': start_time})
+      if rows:
+          last_id = db.session.query(db.func.max(Show.id)).scalar() or 0
+          db.session.execute(Show.__table__.insert(), rows)
+          # the bulk insert skips the show count and calendar events
+          recount_shows(Venue, set(row['venue_id'] for row in rows))
+          recount_shows(Artist, set(row['artist_id'] for row in rows))
+          refresh_show_calendar(db.session.connection(), Show.id > last_id)
+  else:
+      model, genre_table, owner_fk = {
+        'venues': (Venue, venue_genres, 'venue_id'),
+        'artists': (Artist, artist_genres, 'artist_id'),
+      }[kind]
+      # ids of the existing genres, read before the new ones are flushed so
+      # the shared map never holds ids of this uncommitted batch
+      names = set(name for _, data in batch for name in data['genres'])
+      ids = dict((name, genre_id(name)) for name in names)
+      missing = [Genre(name=name) for name, id in ids.items() if id is None]
+      if missing:
+          db.session.add_all(missing)
+          db.session.flush()
+          ids.update((genre.name, genre.id) for genre in missing)
+      # form fields only; the ids and show counts are left to their defaults
+      fields = batch[0][1]
+      columns = [column.key for column in model.__table__.columns if column.key != 'id' and column.key in fields]
+      listings = [model(**dict((column, data.get(column)) for column in columns)) for _, data in batch]
+      db.session.add_all(listings)
+      db.session.flush()
+      links = [{owner_fk: listing.id, 'genre_id': ids[name]}
+               for listing, (_, data) in zip(listings, batch) for name in set(data['genres'])]
+      if links:
+          db.session.execute(genre_table.insert(), links)
+  db.session.commit()
+  db.session.expunge_all()
+  return rejected
+
+
+@app.cli.command('import-listings')
+@click.argument('kind', type=click.Choice(sorted(IMPORT_FORMS)))
+@click.argument('source', type=click.File('r'))
+@click.option('--format', 'format', type=click.Choice(['csv', 'jsonl']),
+              help='Defaults to the extension of SOURCE.')
+@click.option('--batch-size', default=1000, show_default=True)
+def import_listings(kind, source, format, batch_size):
+  """Bulk-load venues, artists or shows from a CSV or JSON-lines file.
+
+  Rows are streamed, validated with the create-page forms and inserted in
+  batches; rejected rows are reported on stderr with their line number.
+  Use - as SOURCE to read stdin.
+  """
+  if format is None:
+      format = 'csv' if source.name.endswith('.csv') else 'jsonl'
+  form_class = IMPORT_FORMS[kind]
+  imported = rejected = 0
+  start = time.perf_counter()
+
+  def reject(line_number, error):
+      click.echo('line %d: %s' % (line_number, error), err=True)
+
+  rows = read_import_rows(source, format)
+  with app.test_request_context():
+      while True:
+          chunk = list(islice(rows, batch_size))
+          if not chunk:
+              break
+          batch = []
+          for line_number, row, error in chunk:
+              if row is not None:
+                  data, error = validate_import_row(form_class, row)
+              if error is None:
+                  batch.append((line_number, data))
+              else:
+                  rejected += 1
+                  reject(line_number, error)
+          if not batch:
+              continue
+          try:
+              failed = import_batch(kind, batch)
+          except Exception as e:
+              db.session.rollback()
+              failed = [(line_number, 'batch failed: %s' % e) for line_number, _ in batch]
+          for line_number, error in failed:
+              reject(line_number, error)
+          rejected += len(failed)
+          imported += len(batch) - len(failed)
+  elapsed = time.perf_counter() - start
+  click.echo('%d %s imported, %d rejected in %.1fs (%.0f rows/s)'
+             % (imported, kind, rejected, elapsed, (imported + rejected) / elapsed if elapsed else 0))
+
+
+@app.cli.command('export-listings')
+@click.argument('kind', type=click.Choice(sorted(EXPORT_TABLES)))
+@click.argument('output', type=click.File('wb'), default='-')
+@click.option('--format', 'format', type=click.Choice(sorted(EXPORT_FORMATS)),
+              help='Defaults to the extension of OUTPUT, or csv.')
+@click.option('--gzip', 'compress', is_flag=True, help='Compress the output; implied by a .gz OUTPUT.')
+@click.option('--batch-size', default=EXPORT_BATCH_SIZE, show_default=True)
+def export_listings(kind, output, format, compress, batch_size):
+  """Dump every venue, artist or show to a CSV or JSON-lines file.
+
+  Rows are streamed from the database batch by batch, so memory use does
+  not grow with the table. Use - as OUTPUT (the default) to write stdout.
+  """
+  name = output.name if isinstance(output.name, str) else ''
+  if name.endswith('.gz'):
+      compress = True
+      name = name[:-len('.gz')]
+  if format is None:
+      format = 'jsonl' if name.endswith('.jsonl') else 'csv'
+  chunks = export_chunks(kind, format, batch_size)
+  if compress:
+      chunks = gzip_chunks(chunks)
+  for chunk in chunks:
+      output.write(chunk if compress else chunk.encode('utf-8'))
+
+
+def invalidate_pages(groups):
+  # Page invalidation from a CLI command. With the in-process LRU backend it
+  # only reaches this process, not the web workers, whose pages stay stale
+  # until CACHE_TTL runs out; say so rather than pretend.
+  page_cache.invalidate(groups)
+  if not page_cache.backend.shared:
+      click.echo('warning: CACHE_TYPE=%s is per process, the web workers keep their cached pages '
+                 'for up to %ds; use CACHE_TYPE=redis to invalidate them from here'
+                 % (app.config.get('CACHE_TYPE', 'lru'), app.config.get('CACHE_TTL', 60)), err=True)
+
+
+@app.cli.command('roll-over-shows')
+def roll_over_shows_command():
+  """Move shows that have started from the upcoming to the past counts.
+
+  Also creates the coming months' shows partitions on PostgreSQL, so
+  running it from cron keeps both up to date.
+  """
+  moved = roll_over_shows()
+  if moved:
+      # 'artists' for the show counts in /api/v1/artists
+      invalidate_pages(['venues', 'artists', 'venue_pages', 'artist_pages'])
+  click.echo('%d shows rolled over' % moved)
+  created = prepare_show_partitions()
+  if created:
+      click.echo('created %s' % ', '.join(created))
+
+
+@app.cli.command('check-show-counts')
+@click.option('--fix', is_flag=True, help='Recompute the counts of the drifted rows.')
+def check_show_counts(fix):
+  """Compare the stored show counts with the shows table.
+
+  Prints every venue and artist whose counts drifted and exits with status
+  1 if any did (unless --fix rewrote them).
+  """
+  drifted = 0
+  for model in (Venue, Artist):
+      rows = show_count_drift(model)
+      for id, upcoming, actual_upcoming, past, actual_past in rows:
+          click.echo('%s %d: upcoming %d (actual %d), past %d (actual %d)'
+                     % (model.__tablename__, id, upcoming, actual_upcoming, past, actual_past))
+      if rows and fix:
+          recount_shows(model, [row[0] for row in rows])
+      drifted += len(rows)
+  if fix:
+      db.session.commit()
+  click.echo('%d rows drifted%s' % (drifted, ', fixed' if fix and drifted else ''))
+  if drifted and not fix:
+      sys.exit(1)
+
+
+@app.cli.command('refresh-show-calendar')
+def refresh_show_calendar_command():
+  """Rebuild the show calendar behind /shows?city= from the shows table."""
+  refresh_show_calendar(db.session.connection())
+  db.session.commit()
+  invalidate_pages(['shows'])
+  click.echo('%d shows in the calendar' % db.session.query(db.func.count()).select_from(show_calendar).scalar())
+
+
+def prepare_show_partitions(ahead=3):
+  # Names of the shows partitions created for this month and the `ahead`
+  # next ones, or None when shows is not partitioned.
+  connection = db.session.connection()
+  if not partitions.is_partitioned(connection):
+      return None
+  created = partitions.create_partitions(connection, datetime.now(), ahead)
+  db.session.commit()
+  return created
+
+
+@app.cli.command('create-show-partitions')
+@click.option('--ahead', default=3, show_default=True, help='Months after this one to prepare.')
+def create_show_partitions(ahead):
+  """Create the monthly shows partitions for this month and the next ones."""
+  created = prepare_show_partitions(ahead)
+  if created is None:
+      click.echo('shows is not partitioned')
+  else:
+      click.echo('created %s' % (', '.join(created) if created else 'no partitions'))
+
+
+@app.cli.command('archive-show-partitions')
+@click.option('--before', required=True, type=click.DateTime(['%Y-%m-%d', '%Y-%m']),
+              help='Detach the months before this date (YYYY-MM or YYYY-MM-DD).')
+@click.option('--drop', is_flag=True, help='Drop the detached partitions instead of moving them to the archive schema.')
+def archive_show_partitions(before, drop):
+  """Detach old monthly shows partitions.
+
+  Their shows leave the site: the calendar rows go and the venues and
+  artists that played them are recounted.
+  """
+  connection = db.session.connection()
+  if not partitions.is_partitioned(connection):
+      click.echo('shows is not partitioned')
+      return
+  detached = partitions.detach_partitions(connection, before, drop)
+  for name, venue_ids, artist_ids in detached:
+      month = datetime.strptime(name, 'shows_%Y_%m')
+      db.session.execute(show_calendar.delete().where(db.and_(
+        show_calendar.c.start_time >= month,
+        show_calendar.c.start_time < partitions.add_months(month.date(), 1))))
+      recount_shows(Venue, venue_ids)
+      recount_shows(Artist, artist_ids)
+      click.echo('%s %s' % ('dropped' if drop else 'archived', name))
+  db.session.commit()
+  if detached:
+      invalidate_pages(['venues', 'artists', 'shows', 'venue_pages', 'artist_pages'])
+  click.echo('%d partitions detached' % len(detached))
+
+
 if not app.debug:
     file_handler = FileHandler('error.log')
     file_handler.setFormatter(
@@ -0,0 +1,11 @@
+# ASGI entry point, e.g.
+#   ASYNC_DETAIL_PAGES=true uvicorn asgi:application --workers 4
+# Flask stays a WSGI app: asgiref runs each request in a worker thread, which
+# it holds until the response is done, so the async detail pages overlap
+# their statements on the async engine but do not free workers.
+
+from asgiref.wsgi import WsgiToAsgi
+
+from app import app
+
+application = WsgiToAsgi(app)
@@ -0,0 +1,78 @@
+#----------------------------------------------------------------------------#
+# Async database access for the detail pages.
+#
+# With ASYNC_DETAIL_PAGES on, show_venue and show_artist send their
+# independent statements at the same time over an async driver (asyncpg for
+# PostgreSQL, aiosqlite for SQLite; neither is needed otherwise) instead of
+# one after another. The async engine lives on a single event loop running
+# in a background thread, so its pooled connections are shared by every
+# request thread; views hand it coroutines with AsyncDatabase.run.
+#
+# Statements sent this way bypass the replica routing and the per-request
+# SQL profile, which only see the session's own engines.
+#----------------------------------------------------------------------------#
+
+import asyncio
+import threading
+
+
+def async_database_uri(database_uri):
+    """The async driver URL for a sync SQLALCHEMY_DATABASE_URI."""
+    scheme, rest = database_uri.split('://', 1)
+    dialect = scheme.split('+')[0]
+    if dialect in ('postgres', 'postgresql'):
+        return 'postgresql+asyncpg://' + rest
+    if dialect == 'sqlite':
+        return 'sqlite+aiosqlite://' + rest
+    raise ValueError('No async driver known for %r' % scheme)
+
+
+class AsyncDatabase(object):
+    """An async engine driven from sync code through a private event loop."""
+
+    def __init__(self, app=None):
+        self.engine = None
+        self.loop = None
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    @property
+    def enabled(self):
+        return self.engine is not None
+
+    def init_app(self, app):
+        if not app.config.get('ASYNC_DETAIL_PAGES'):
+            return
+        self.configure(app.config.get('SQLALCHEMY_ASYNC_DATABASE_URI') or
+                       async_database_uri(app.config['SQLALCHEMY_DATABASE_URI']),
+                       app.config.get('SQLALCHEMY_ASYNC_ENGINE_OPTIONS', {}))
+
+    def configure(self, uri, engine_options=None):
+        # optional dependency: sqlalchemy.ext.asyncio needs greenlet
+        from sqlalchemy.ext.asyncio import create_async_engine
+        with self.lock:
+            if self.engine is not None:
+                self.run(self.engine.dispose())
+                self.engine = None
+            if uri is None:
+                return
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=self.loop.run_forever, name='async-db')
+                thread.daemon = True
+                thread.start()
+            self.engine = create_async_engine(uri, **(engine_options or {}))
+
+    def run(self, coroutine):
+        """Runs `coroutine` on the database loop and waits for its result."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    async def fetch(self, statement):
+        async with self.engine.connect() as connection:
+            result = await connection.execute(statement)
+            return result.all()
+
+    async def fetch_all(self, *statements):
+        """Results of `statements`, each sent on its own connection at once."""
+        return await asyncio.gather(*[self.fetch(statement) for statement in statements])
@@ -0,0 +1,59 @@
+# Throughput of the venue page queries at increasing concurrency: the sync
+# worker model (one thread per request, statements one after another) versus
+# app.venue_detail_async, which overlaps the page's statements on the async
+# engine. Needs greenlet and the async driver for DATABASE_URL (aiosqlite for
+# the default SQLite file, asyncpg for PostgreSQL). SQLite answers from the
+# local page cache, so the gap that round trips open up only shows against a
+# networked PostgreSQL server.
+#
+#   python -m benchmarks.async_detail [pages] [concurrency ...]
+
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import app, db, seed
+from app import async_db, venue_detail, venue_detail_async
+from async_db import async_database_uri
+
+
+def sync_page(venue_id):
+  with app.app_context():
+      try:
+          return venue_detail(venue_id)
+      finally:
+          db.session.remove()
+
+
+def async_page(venue_id):
+  return async_db.run(venue_detail_async(venue_id))
+
+
+def throughput(fn, pages, venues, concurrency):
+  # pages per second with `concurrency` request threads
+  venue_ids = [i % venues + 1 for i in range(pages)]
+  start = time.perf_counter()
+  with ThreadPoolExecutor(concurrency) as pool:
+      list(pool.map(fn, venue_ids))
+  return pages / (time.perf_counter() - start)
+
+
+def main():
+  pages = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+  levels = [int(level) for level in sys.argv[2:]] or [1, 8, 32, 64]
+  venues = 1000
+  with app.app_context():
+      seed(venues=venues, artists=500, shows=50000)
+      db.session.remove()
+  async_db.configure(async_database_uri(app.config['SQLALCHEMY_DATABASE_URI']),
+                     {'pool_size': max(levels), 'max_overflow': 3 * max(levels)})
+  print('%-12s %14s %14s' % ('concurrency', 'sync pages/s', 'async pages/s'))
+  for concurrency in levels:
+      print('%-12d %14.0f %14.0f' % (
+        concurrency,
+        throughput(sync_page, pages, venues, concurrency),
+        throughput(async_page, pages, venues, concurrency)))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,112 @@
+# Shared helpers for the fyyur benchmarks.
+#
+# Run the benchmarks from the starter_code directory, e.g.
+#   python -m benchmarks.venue_directory
+# They point the app at DATABASE_URL (a throwaway SQLite file by default) and
+# drop and recreate every table in it before seeding, so never aim them at a
+# database you care about.
+
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault(
+  'DATABASE_URL',
+  'sqlite:///' + os.path.join(tempfile.gettempdir(), 'fyyur_bench.db'))
+
+from app import app, db, count_queries, recount_shows, refresh_show_calendar, Venue, Artist, Show, Genre, venue_genres, artist_genres
+
+GENRES = ['Alternative', 'Blues', 'Classical', 'Country', 'Electronic', 'Folk',
+          'Funk', 'Hip-Hop', 'Heavy Metal', 'Instrumental', 'Jazz',
+          'Musical Theatre', 'Pop', 'Punk', 'R&B', 'Reggae', 'Rock n Roll',
+          'Soul', 'Other']
+
+
+def skewed(rnd, count, skew):
+  # Draws ids 1..count with Zipf-like weights 1/rank**skew, so a few venues,
+  # artists and cities get most of the shows the way real listings do.
+  # skew=0 is uniform.
+  cum_weights = []
+  total = 0.0
+  for rank in range(1, count + 1):
+      total += 1.0 / rank ** skew
+      cum_weights.append(total)
+  ids = list(range(1, count + 1))
+  return lambda k=1: rnd.choices(ids, cum_weights=cum_weights, k=k)
+
+
+def genre_names(genres):
+  return (GENRES + ['Genre %d' % i for i in range(len(GENRES), genres)])[:genres]
+
+
+def seed(venues=10000, artists=2000, shows=50000, cities=300, genres=len(GENRES), skew=1.0, seed=1):
+  # Recreates the schema and fills it with synthetic rows using executemany
+  # inserts. Ids start at 1 on the fresh tables, which the show and genre
+  # rows rely on. Cities, genres and the venues and artists of shows are
+  # drawn with `skew` (see skewed). Must be called inside an app context.
+  rnd = random.Random(seed)
+  db.drop_all()
+  db.create_all()
+  now = datetime.now()
+  areas = [('City %d' % i, 'S%d' % (i % 50)) for i in range(cities)]
+  area = skewed(rnd, cities, skew)
+  genre = skewed(rnd, genres, skew)
+  venue_rows = []
+  for i in range(venues):
+      city, state = areas[area()[0] - 1]
+      venue_rows.append({
+        'name': 'Venue %d' % i, 'city': city, 'state': state,
+        'address': '%d Main Street' % i, 'image_link': 'https://example.com/v/%d' % i,
+      })
+  artist_rows = []
+  for i in range(artists):
+      city, state = areas[area()[0] - 1]
+      artist_rows.append({
+        'name': 'Artist %d' % i, 'city': city, 'state': state,
+        'image_link': 'https://example.com/a/%d' % i,
+      })
+  show_venues = skewed(rnd, venues, skew)(shows)
+  show_artists = skewed(rnd, artists, skew)(shows)
+  show_rows = [{
+      'artist_id': artist_id,
+      'venue_id': venue_id,
+      'start_time': now + timedelta(hours=rnd.randint(-24 * 365, 24 * 180)),
+    } for artist_id, venue_id in zip(show_artists, show_venues)]
+  genre_rows = [{'name': name} for name in genre_names(genres)]
+  # one or two distinct genres per venue and artist
+  venue_genre_rows = [{'venue_id': i + 1, 'genre_id': genre_id}
+                      for i in range(venues) for genre_id in set(genre(rnd.randint(1, 2)))]
+  artist_genre_rows = [{'artist_id': i + 1, 'genre_id': genre_id}
+                       for i in range(artists) for genre_id in set(genre(rnd.randint(1, 2)))]
+  db.session.execute(Venue.__table__.insert(), venue_rows)
+  db.session.execute(Artist.__table__.insert(), artist_rows)
+  db.session.execute(Show.__table__.insert(), show_rows)
+  db.session.execute(Genre.__table__.insert(), genre_rows)
+  db.session.execute(venue_genres.insert(), venue_genre_rows)
+  db.session.execute(artist_genres.insert(), artist_genre_rows)
+  recount_shows(Venue)
+  recount_shows(Artist)
+  refresh_show_calendar(db.session.connection())
+  db.session.commit()
+
+
+def measure(fn, repeat=5):
+  # Runs fn repeat times with a fresh session and returns the best wall time
+  # in milliseconds together with the number of statements of the last run.
+  best = None
+  for _ in range(repeat):
+      db.session.remove()
+      with count_queries() as counter:
+          start = time.perf_counter()
+          fn()
+          elapsed = (time.perf_counter() - start) * 1000
+      best = elapsed if best is None else min(best, elapsed)
+  return best, counter['queries']
+
+
+def report(name, fn, repeat=5):
+  elapsed, queries = measure(fn, repeat)
+  print('%-28s %10.1f ms %8d queries' % (name, elapsed, queries))
+  return elapsed, queries
@@ -0,0 +1,49 @@
+# Compares the old `datetime` Jinja filter, fed str(start_time) and re-parsing
+# it with dateutil on every call, with app.format_datetime on datetime objects
+# and cached babel patterns.
+#
+#   python -m benchmarks.datetime_filter [timestamps]
+
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+
+from benchmarks.common import app
+from app import format_datetime
+
+
+def legacy_format_datetime(value, format='medium'):
+  date = dateutil.parser.parse(value)
+  if format == 'full':
+      format="EEEE MMMM, d, y 'at' h:mma"
+  elif format == 'medium':
+      format="EE MM, dd, y h:mma"
+  return babel.dates.format_datetime(date, format)
+
+
+def timed(name, fn, values):
+  start = time.perf_counter()
+  result = [fn(value) for value in values]
+  elapsed = (time.perf_counter() - start) * 1000
+  print('%-28s %10.1f ms %8.2f us/row' % (name, elapsed, elapsed * 1000 / len(values)))
+  return result
+
+
+def main():
+  count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+  rnd = random.Random(1)
+  now = datetime.now()
+  timestamps = [now + timedelta(minutes=rnd.randint(-10 ** 6, 10 ** 6)) for _ in range(count)]
+  for format in ('full', 'medium'):
+      print('format=%s, %d timestamps' % (format, count))
+      old = timed('str() + dateutil + babel', lambda value: legacy_format_datetime(str(value), format), timestamps)
+      new = timed('format_datetime', lambda value: format_datetime(value, format), timestamps)
+      assert old == new, 'filters disagree'
+
+
+if __name__ == '__main__':
+  main()
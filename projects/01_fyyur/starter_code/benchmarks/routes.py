@@ -0,0 +1,273 @@
+# Drives every fyyur route against a seeded database and records latency
+# percentiles and statements per request, through the Flask test client and
+# through a real WSGI server on a local port.
+#
+#   python -m benchmarks.routes [--venues N] [--shows N] [--skew S] ...
+#   python -m benchmarks.routes --compare benchmarks/results/<commit>.json
+#
+# Results are written as JSON (benchmarks/results/<commit>.json by default)
+# so two commits can be compared with --compare. The page cache is off
+# unless CACHE_TYPE is set, so every request renders its page.
+
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import re
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+
+os.environ.setdefault('CACHE_TYPE', 'null')
+# the statements per request come from the profiler's Server-Timing header
+os.environ.setdefault('SQL_PROFILING', 'true')
+
+from werkzeug.serving import make_server
+
+from benchmarks.common import app, db, seed, skewed, genre_names, Venue, Artist, Show
+
+SERVER_TIMING_QUERIES = re.compile(r'db;[^,]*desc="(\d+) queries"')
+
+# The submission routes answer 200 whether or not the row went in, so the
+# rows they add are counted to make sure the error path is not what got timed.
+CREATE_ROUTES = {
+  'create_venue_submission': Venue,
+  'create_artist_submission': Artist,
+  'create_show_submission': Show,
+}
+
+
+def routes(rnd, venues, artists, genres, cities, skew):
+  # (name, method, path, form) for every route, with the ids drawn with the
+  # same skew as the seeded shows so popular pages are requested more often.
+  venue = skewed(rnd, venues, skew)
+  artist = skewed(rnd, artists, skew)
+  genre = skewed(rnd, genres, skew)
+  names = genre_names(genres)
+  area = skewed(rnd, cities, skew)
+  weekend = datetime.now().date() + timedelta(days=rnd.randint(0, 60))
+  later = (datetime.now() + timedelta(days=rnd.randint(1, 90))).strftime('%Y-%m-%d %H:%M:%S')
+  return [
+      ('index', 'GET', '/', None),
+      ('venues', 'GET', '/venues', None),
+      ('venues_by_genre', 'GET', '/venues?' + urlencode({'genre': names[genre()[0] - 1]}), None),
+      ('search_venues', 'POST', '/venues/search', {'search_term': 'Venue %d' % rnd.randint(0, 99)}),
+      ('show_venue', 'GET', '/venues/%d' % venue()[0], None),
+      ('create_venue_form', 'GET', '/venues/create', None),
+      ('create_venue_submission', 'POST', '/venues/create', {
+          'name': 'Bench Venue %d' % rnd.randint(0, 10 ** 9), 'city': 'City 1', 'state': 'CA',
+          'address': '1 Bench Street', 'genres': names[genre()[0] - 1],
+          'facebook_link': 'https://facebook.com/bench'}),
+      ('edit_venue', 'GET', '/venues/%d/edit' % venue()[0], None),
+      ('edit_venue_submission', 'POST', '/venues/%d/edit' % venue()[0], {}),
+      ('artists', 'GET', '/artists', None),
+      ('artists_by_genre', 'GET', '/artists?' + urlencode({'genre': names[genre()[0] - 1]}), None),
+      ('search_artists', 'POST', '/artists/search', {'search_term': 'Artist %d' % rnd.randint(0, 99)}),
+      ('show_artist', 'GET', '/artists/%d' % artist()[0], None),
+      ('create_artist_form', 'GET', '/artists/create', None),
+      ('create_artist_submission', 'POST', '/artists/create', {
+          'name': 'Bench Artist %d' % rnd.randint(0, 10 ** 9), 'city': 'City 1', 'state': 'CA',
+          'genres': names[genre()[0] - 1], 'facebook_link': 'https://facebook.com/bench'}),
+      ('edit_artist', 'GET', '/artists/%d/edit' % artist()[0], None),
+      ('edit_artist_submission', 'POST', '/artists/%d/edit' % artist()[0], {}),
+      ('shows', 'GET', '/shows', None),
+      ('shows_upcoming', 'GET', '/shows?when=upcoming', None),
+      ('shows_in_city', 'GET', '/shows?' + urlencode({
+          'city': 'City %d' % (area()[0] - 1), 'from': weekend.isoformat(),
+          'to': (weekend + timedelta(days=2)).isoformat()}), None),
+      ('create_shows', 'GET', '/shows/create', None),
+      ('create_show_submission', 'POST', '/shows/create', {
+          'artist_id': artist()[0], 'venue_id': venue()[0], 'start_time': later}),
+  ]
+
+
+def client_request(client):
+  def send(method, path, form):
+      response = client.open(path, method=method, data=form)
+      response.close()
+      return response.status_code, response.headers.get('Server-Timing', '')
+  return send
+
+
+def server_request(port):
+  def send(method, path, form):
+      connection = http.client.HTTPConnection('127.0.0.1', port)
+      try:
+          body = urlencode(form) if form is not None else None
+          headers = {'Content-Type': 'application/x-www-form-urlencoded'} if form is not None else {}
+          connection.request(method, path, body, headers)
+          response = connection.getresponse()
+          response.read()
+          return response.status, response.getheader('Server-Timing', '')
+      finally:
+          connection.close()
+  return send
+
+
+def percentile(values, fraction):
+  # nearest-rank percentile of an already sorted list
+  return values[max(0, int(round(fraction * len(values))) - 1)]
+
+
+def drive(send, requests, rnd, dataset, concurrency=1):
+  # Sends `requests` rounds of every route and summarizes each route.
+  samples = {}
+  lock = threading.Lock()
+
+  def one(route):
+      name, method, path, form = route
+      start = time.perf_counter()
+      status, timing = send(method, path, form)
+      elapsed = (time.perf_counter() - start) * 1000
+      match = SERVER_TIMING_QUERIES.search(timing)
+      with lock:
+          samples.setdefault(name, []).append((elapsed, int(match.group(1)) if match else None, status))
+
+  plan = [route for _ in range(requests)
+          for route in routes(rnd, dataset['venues'], dataset['artists'], dataset['genres'], dataset['cities'],
+                              dataset['skew'])]
+  if concurrency > 1:
+      with ThreadPoolExecutor(concurrency) as pool:
+          list(pool.map(one, plan))
+  else:
+      for route in plan:
+          one(route)
+
+  summary = {}
+  for name, values in sorted(samples.items()):
+      latencies = sorted(value[0] for value in values)
+      queries = [value[1] for value in values if value[1] is not None]
+      summary[name] = {
+          'requests': len(values),
+          'errors': sum(1 for value in values if value[2] >= 500),
+          'p50_ms': round(percentile(latencies, 0.50), 3),
+          'p95_ms': round(percentile(latencies, 0.95), 3),
+          'p99_ms': round(percentile(latencies, 0.99), 3),
+          'queries_per_request': round(float(sum(queries)) / len(queries), 2) if queries else None,
+          'max_queries': max(queries) if queries else None,
+      }
+  return summary
+
+
+def row_counts():
+  with app.app_context():
+      counts = dict((name, model.query.count()) for name, model in CREATE_ROUTES.items())
+      db.session.remove()
+  return counts
+
+
+def check_created(before, summary):
+  # Fails the run if a submission route added fewer rows than it was sent.
+  after = row_counts()
+  for name, count in sorted(before.items()):
+      created, sent = after[name] - count, summary[name]['requests']
+      if created != sent:
+          raise SystemExit('%s created %d rows for %d requests' % (name, created, sent))
+
+
+def serve():
+  # Runs the app on a free local port in a background thread, without the
+  # per-request access log.
+  logging.getLogger('werkzeug').setLevel(logging.WARNING)
+  server = make_server('127.0.0.1', 0, app, threaded=True)
+  thread = threading.Thread(target=server.serve_forever)
+  thread.daemon = True
+  thread.start()
+  return server
+
+
+def current_commit():
+  try:
+      return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                     stderr=subprocess.DEVNULL).decode('ascii').strip()
+  except (OSError, subprocess.CalledProcessError):
+      return None
+
+
+def print_summary(mode, summary, baseline=None):
+  print('\n%s' % mode)
+  print('%-26s %9s %9s %9s %9s %10s' % ('route', 'p50 ms', 'p95 ms', 'p99 ms', 'queries', 'p95 delta'))
+  for name, stats in summary.items():
+      delta = ''
+      if baseline and name in baseline and baseline[name]['p95_ms']:
+          delta = '%+.1f%%' % ((stats['p95_ms'] / baseline[name]['p95_ms'] - 1) * 100)
+      queries = '-' if stats['queries_per_request'] is None else '%.1f' % stats['queries_per_request']
+      print('%-26s %9.2f %9.2f %9.2f %9s %10s' % (
+          name, stats['p50_ms'], stats['p95_ms'], stats['p99_ms'], queries, delta))
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Benchmark every fyyur route.')
+  parser.add_argument('--venues', type=int, default=10000)
+  parser.add_argument('--artists', type=int, default=2000)
+  parser.add_argument('--shows', type=int, default=50000)
+  parser.add_argument('--genres', type=int, default=19)
+  parser.add_argument('--cities', type=int, default=300)
+  parser.add_argument('--skew', type=float, default=1.0,
+                      help='Zipf exponent for popular venues, artists, cities and genres (0 is uniform)')
+  parser.add_argument('--requests', type=int, default=50, help='rounds of every route per mode')
+  parser.add_argument('--concurrency', type=int, default=1, help='parallel clients against the WSGI server')
+  parser.add_argument('--mode', choices=['client', 'server', 'both'], default='both')
+  parser.add_argument('--output', help='JSON results path (default benchmarks/results/<commit>.json)')
+  parser.add_argument('--compare', help='earlier JSON results to compare p95 latencies against')
+  parser.add_argument('--seed', type=int, default=1)
+  args = parser.parse_args()
+
+  dataset = {
+      'venues': args.venues, 'artists': args.artists, 'shows': args.shows,
+      'genres': args.genres, 'cities': args.cities, 'skew': args.skew, 'seed': args.seed,
+  }
+  with app.app_context():
+      seed(**dataset)
+      db.session.remove()
+
+  commit = current_commit()
+  results = {
+      'commit': commit,
+      'created': datetime.now().isoformat(timespec='seconds'),
+      'database': app.config['SQLALCHEMY_DATABASE_URI'].split(':')[0],
+      'dataset': dataset,
+      'requests': args.requests,
+      'concurrency': args.concurrency,
+      'modes': {},
+  }
+  baseline = {}
+  if args.compare:
+      with open(args.compare) as previous:
+          baseline = json.load(previous)['modes']
+
+  if args.mode in ('client', 'both'):
+      before = row_counts()
+      results['modes']['client'] = drive(
+          client_request(app.test_client()), args.requests, random.Random(args.seed), dataset)
+      check_created(before, results['modes']['client'])
+      print_summary('Flask test client', results['modes']['client'], baseline.get('client'))
+  if args.mode in ('server', 'both'):
+      before = row_counts()
+      server = serve()
+      try:
+          results['modes']['server'] = drive(
+              server_request(server.server_port), args.requests, random.Random(args.seed), dataset,
+              args.concurrency)
+      finally:
+          server.shutdown()
+      check_created(before, results['modes']['server'])
+      print_summary('WSGI server (concurrency %d)' % args.concurrency,
+                    results['modes']['server'], baseline.get('server'))
+
+  output = args.output or os.path.join(
+      os.path.dirname(__file__), 'results', '%s.json' % (commit or 'results'))
+  if os.path.dirname(output):
+      os.makedirs(os.path.dirname(output), exist_ok=True)
+  with open(output, 'w') as results_file:
+      json.dump(results, results_file, indent=2, sort_keys=True)
+  print('\nwrote %s' % output)
+
+
+if __name__ == '__main__':
+  main()
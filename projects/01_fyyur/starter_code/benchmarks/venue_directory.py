@@ -0,0 +1,40 @@
+# Compares the per-area /venues implementation with the single grouped query
+# in app.venue_directory against a seeded 10k-venue database.
+#
+#   python -m benchmarks.venue_directory [venues]
+
+import sys
+
+from benchmarks.common import app, db, seed, report, Venue
+
+
+def legacy_venue_directory():
+  # The original /venues handler: one query per area plus a lazy load of
+  # venue.shows for every venue.
+  data = []
+  city_state = db.session.query(Venue.city, Venue.state).group_by(Venue.city, Venue.state).all()
+  for value in city_state:
+      venues = Venue.query.filter_by(city=value[0]).filter_by(state=value[1]).all()
+      data.append({
+        "city": value[0],
+        "state": value[1],
+        "venues": [{
+          "id": venue.id,
+          "name": venue.name,
+          "num_upcoming_shows": len(venue.shows),
+        } for venue in venues]
+      })
+  return data
+
+
+def main():
+  from app import venue_directory
+  venues = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+  with app.app_context():
+      seed(venues=venues, shows=venues * 5)
+      report('legacy per-area queries', legacy_venue_directory, repeat=1)
+      report('venue_directory', venue_directory)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,243 @@
+#----------------------------------------------------------------------------#
+# Page cache for the read-heavy fyyur pages.
+#
+# A cached page is stored under its path, query string and the current
+# generation of every group it depends on (e.g. 'venues' or 'venue:3').
+# Invalidating a group only bumps its generation, so stale entries are never
+# looked up again and simply age out of the backend.
+#----------------------------------------------------------------------------#
+
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import request, session
+from sqlalchemy import event
+
+
+class LRUCache(object):
+    """In-process cache with a size bound and a per-entry time to live.
+
+    Every process has its own entries and generations, so an invalidation
+    only reaches the process that made it.
+    """
+
+    shared = False
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self.lock:
+            self.entries[key] = (value, expires)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def incr(self, key):
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + 1
+            return self.counters[key]
+
+    def generation(self, key):
+        return self.counters.get(key, 0)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.counters.clear()
+
+
+class RedisCache(object):
+    """Cache in a Redis-compatible server, shared by every worker process.
+
+    Takes a client with the redis-py interface (get/setex/incr), e.g.
+    redis.Redis.from_url('redis://localhost:6379/0'); anything speaking the
+    Redis protocol (Redis, KeyDB, a local stand-in) works.
+    """
+
+    shared = True
+
+    def __init__(self, client, ttl=60, prefix='fyyur:'):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return None if value is None else value.decode('utf-8')
+
+    def set(self, key, value, ttl=None):
+        self.client.setex(self.prefix + key, self.ttl if ttl is None else ttl, value.encode('utf-8'))
+
+    def incr(self, key):
+        return self.client.incr(self.prefix + 'generation:' + key)
+
+    def generation(self, key):
+        value = self.client.get(self.prefix + 'generation:' + key)
+        return 0 if value is None else int(value)
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+
+class NullCache(object):
+    """Caches nothing; for tests and debugging."""
+
+    shared = True
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def incr(self, key):
+        return 0
+
+    def generation(self, key):
+        return 0
+
+    def clear(self):
+        pass
+
+
+def cache_from_config(config):
+    cache_type = config.get('CACHE_TYPE', 'lru')
+    ttl = config.get('CACHE_TTL', 60)
+    if cache_type == 'lru':
+        return LRUCache(config.get('CACHE_MAXSIZE', 1024), ttl)
+    if cache_type == 'redis':
+        # optional dependency, only needed for this backend
+        import redis
+        return RedisCache(redis.Redis.from_url(config['CACHE_REDIS_URL']), ttl)
+    if cache_type == 'null':
+        return NullCache()
+    raise ValueError('Unknown CACHE_TYPE %r' % cache_type)
+
+
+class PageCache(object):
+    """Caches rendered GET pages and invalidates them by group."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.fresh_for = 0
+        self.read_fresh = None
+
+    def render_fresh(self, seconds, read_fresh):
+        """Calls `read_fresh()` before rendering a miss of a page whose
+        groups were invalidated in the last `seconds`.
+
+        With read replicas, such a page would otherwise be read from a
+        replica that may not have the change yet, and cached stale for the
+        whole TTL; `read_fresh` sends the request's reads to the primary.
+        """
+        self.fresh_for = seconds
+        self.read_fresh = read_fresh
+
+    def recently_invalidated(self, groups):
+        return any(self.backend.get('invalidated:' + group) is not None for group in groups)
+
+    def key(self, groups):
+        generations = ','.join('%s=%d' % (group, self.backend.generation(group)) for group in groups)
+        return 'page:%s?%s|%s' % (request.path, request.query_string.decode('utf-8'), generations)
+
+    def cached(self, groups):
+        """Decorator caching a view's 200 responses.
+
+        `groups` maps the view's keyword arguments to the groups the page
+        depends on, e.g. lambda venue_id: ['venue_pages', 'venue:%d' % venue_id].
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(**kwargs):
+                # a page rendered with pending flash messages is personal
+                if session.get('_flashes'):
+                    return view(**kwargs)
+                page_groups = groups(**kwargs)
+                key = self.key(page_groups)
+                page = self.backend.get(key)
+                if page is not None:
+                    self.hits += 1
+                    return page
+                self.misses += 1
+                if self.read_fresh is not None and self.recently_invalidated(page_groups):
+                    self.read_fresh()
+                response = view(**kwargs)
+                if isinstance(response, str):
+                    self.backend.set(key, response)
+                return response
+            return wrapper
+        return decorator
+
+    def invalidate(self, groups):
+        for group in groups:
+            self.backend.incr(group)
+            if self.fresh_for:
+                self.backend.set('invalidated:' + group, '1', ttl=self.fresh_for)
+
+    def clear(self):
+        self.backend.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'backend': type(self.backend).__name__,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': float(self.hits) / lookups if lookups else 0.0,
+        }
+
+    def watch(self, session, groups_for):
+        """Invalidates pages when a commit on `session` changed model rows.
+
+        `groups_for(instance)` returns the groups touched by a new, changed
+        or deleted instance. Groups are collected at flush time and only
+        invalidated once the transaction commits.
+        """
+        pending = threading.local()
+
+        def collected():
+            if not hasattr(pending, 'groups'):
+                pending.groups = set()
+            return pending.groups
+
+        @event.listens_for(session, 'after_flush')
+        def after_flush(session, flush_context):
+            groups = collected()
+            for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+                groups.update(groups_for(instance))
+
+        @event.listens_for(session, 'after_commit')
+        def after_commit(session):
+            groups = collected()
+            if groups:
+                self.invalidate(groups)
+                groups.clear()
+
+        @event.listens_for(session, 'after_soft_rollback')
+        def after_soft_rollback(session, previous_transaction):
+            collected().clear()
@@ -72,6 +72,13 @@ def run_migrations_online():
                 directives[:] = []
                 logger.info('No changes in schema detected.')
 
+    # the SQLite full-text search tables (and their FTS5 shadow tables) are
+    # managed by hand in the migrations, keep autogenerate away from them
+    def include_object(object, name, type_, reflected, compare_to):
+        if type_ == 'table' and name.startswith(('venue_search', 'artist_search')):
+            return False
+        return True
+
     connectable = engine_from_config(
         config.get_section(config.config_ini_section),
         prefix='sqlalchemy.',
@@ -83,6 +90,7 @@ def run_migrations_online():
             connection=connection,
             target_metadata=target_metadata,
             process_revision_directives=process_revision_directives,
+            include_object=include_object,
             **current_app.extensions['migrate'].configure_args
         )
 
@@ -0,0 +1,108 @@
+"""partition shows by month of start_time on postgres
+
+Revision ID: a6f0d3b9c217
+Revises: c8a1f6e3d472
+Create Date: 2026-10-18 16:40:19.602815
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6f0d3b9c217'
+down_revision = 'c8a1f6e3d472'
+branch_labels = None
+depends_on = None
+
+
+SHOW_INDEXES = [
+    ('ix_shows_start_time_id', ['start_time', 'id']),
+    ('ix_shows_venue_id_start_time', ['venue_id', 'start_time']),
+    ('ix_shows_artist_id_start_time', ['artist_id', 'start_time']),
+]
+
+# One partition per month from the oldest show to the latest one, and at least
+# to three months ahead; the create-show-partitions command keeps adding them
+# afterwards.
+CREATE_MONTHLY_PARTITIONS = """
+DO $$
+DECLARE
+    month date := date_trunc('month', least(coalesce((SELECT min(start_time) FROM shows_unpartitioned), now()), now()));
+    last date := date_trunc('month', greatest(coalesce((SELECT max(start_time) FROM shows_unpartitioned), now()),
+                                              now() + interval '3 months'));
+BEGIN
+    WHILE month <= last LOOP
+        EXECUTE 'CREATE TABLE ' || quote_ident(to_char(month, '"shows_"YYYY_MM'))
+            || ' PARTITION OF shows FOR VALUES FROM (' || quote_literal(month)
+            || ') TO (' || quote_literal((month + interval '1 month')::date) || ')';
+        month := month + interval '1 month';
+    END LOOP;
+END
+$$
+"""
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        # shows stays a plain table; only the calendar loses its foreign key,
+        # which the partitioned table could not back
+        with op.batch_alter_table('show_calendar', naming_convention={
+                'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s'}) as batch_op:
+            batch_op.drop_constraint('fk_show_calendar_show_id_shows', type_='foreignkey')
+        return
+
+    # a unique constraint on a partitioned table has to include start_time,
+    # so nothing can reference shows.id alone
+    op.drop_constraint('show_calendar_show_id_fkey', 'show_calendar', type_='foreignkey')
+    op.execute('ALTER TABLE shows RENAME TO shows_unpartitioned')
+    op.execute('ALTER TABLE shows_unpartitioned RENAME CONSTRAINT shows_pkey TO shows_unpartitioned_pkey')
+    # keep the id sequence when the old table goes
+    op.execute('ALTER SEQUENCE shows_id_seq OWNED BY NONE')
+    op.execute(
+        "CREATE TABLE shows ("
+        "id INTEGER NOT NULL DEFAULT nextval('shows_id_seq'), "
+        'artist_id INTEGER NOT NULL REFERENCES "Artist" (id), '
+        'venue_id INTEGER NOT NULL REFERENCES "Venue" (id), '
+        'start_time TIMESTAMP WITHOUT TIME ZONE NOT NULL, '
+        'PRIMARY KEY (id, start_time)'
+        ') PARTITION BY RANGE (start_time)')
+    op.execute('CREATE TABLE shows_default PARTITION OF shows DEFAULT')
+    op.execute(CREATE_MONTHLY_PARTITIONS)
+    op.execute('INSERT INTO shows (id, artist_id, venue_id, start_time) '
+               'SELECT id, artist_id, venue_id, start_time FROM shows_unpartitioned')
+    op.drop_table('shows_unpartitioned')
+    op.execute('ALTER SEQUENCE shows_id_seq OWNED BY shows.id')
+    for name, columns in SHOW_INDEXES:
+        op.create_index(name, 'shows', columns, unique=False)
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        with op.batch_alter_table('show_calendar') as batch_op:
+            batch_op.create_foreign_key('fk_show_calendar_show_id_shows', 'shows', ['show_id'], ['id'],
+                                        ondelete='CASCADE')
+        return
+
+    op.execute('ALTER TABLE shows RENAME TO shows_partitioned')
+    op.execute('ALTER TABLE shows_partitioned RENAME CONSTRAINT shows_pkey TO shows_partitioned_pkey')
+    op.execute('ALTER SEQUENCE shows_id_seq OWNED BY NONE')
+    for name, _ in SHOW_INDEXES:
+        op.execute('ALTER INDEX %s RENAME TO %s_partitioned' % (name, name))
+    op.execute(
+        "CREATE TABLE shows ("
+        "id INTEGER NOT NULL DEFAULT nextval('shows_id_seq'), "
+        'artist_id INTEGER NOT NULL REFERENCES "Artist" (id), '
+        'venue_id INTEGER NOT NULL REFERENCES "Venue" (id), '
+        'start_time TIMESTAMP WITHOUT TIME ZONE NOT NULL, '
+        'CONSTRAINT shows_pkey PRIMARY KEY (id))')
+    op.execute('INSERT INTO shows (id, artist_id, venue_id, start_time) '
+               'SELECT id, artist_id, venue_id, start_time FROM shows_partitioned')
+    # drops every attached partition; archived ones stay in the archive schema
+    op.drop_table('shows_partitioned')
+    op.execute('ALTER SEQUENCE shows_id_seq OWNED BY shows.id')
+    for name, columns in SHOW_INDEXES:
+        op.create_index(name, 'shows', columns, unique=False)
+    op.execute('DELETE FROM show_calendar WHERE show_id NOT IN (SELECT id FROM shows)')
+    op.create_foreign_key('show_calendar_show_id_fkey', 'show_calendar', 'shows', ['show_id'], ['id'],
+                          ondelete='CASCADE')
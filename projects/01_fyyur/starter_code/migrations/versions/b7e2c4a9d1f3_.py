@@ -0,0 +1,82 @@
+"""add name, city and genre search indexes
+
+Revision ID: b7e2c4a9d1f3
+Revises: 3e5a8161970a
+Create Date: 2026-10-18 10:12:31.204118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e2c4a9d1f3'
+down_revision = '3e5a8161970a'
+branch_labels = None
+depends_on = None
+
+
+TRGM_INDEXES = [
+    ('ix_venue_name_trgm', 'Venue', 'name'),
+    ('ix_venue_city_trgm', 'Venue', 'city'),
+    ('ix_artist_name_trgm', 'Artist', 'name'),
+    ('ix_artist_city_trgm', 'Artist', 'city'),
+    ('ix_genres_name_trgm', 'genres', 'name'),
+]
+
+SEARCH_TABLES = [
+    ('Venue', 'venue_search', 'venue_id'),
+    ('Artist', 'artist_search', 'artist_id'),
+]
+
+
+def sqlite_search_ddl(table, search_table, genre_fk):
+    # Same statements as app.sqlite_search_ddl at the time of this revision.
+    genres = "(SELECT group_concat(name, ' ') FROM genres WHERE %s = {id})" % genre_fk
+    return [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5(name, city, genres, tokenize='trigram')" % search_table,
+        "INSERT INTO %s (%s, rank) VALUES ('rank', 'bm25(10.0, 2.0, 1.0)')" % (search_table, search_table),
+        'CREATE TRIGGER IF NOT EXISTS %s_ai AFTER INSERT ON "%s" BEGIN '
+        "INSERT INTO %s (rowid, name, city, genres) VALUES (new.id, new.name, new.city, ''); END"
+        % (search_table, table, search_table),
+        'CREATE TRIGGER IF NOT EXISTS %s_au AFTER UPDATE OF name, city ON "%s" BEGIN '
+        'UPDATE %s SET name = new.name, city = new.city WHERE rowid = new.id; END'
+        % (search_table, table, search_table),
+        'CREATE TRIGGER IF NOT EXISTS %s_ad AFTER DELETE ON "%s" BEGIN '
+        'DELETE FROM %s WHERE rowid = old.id; END'
+        % (search_table, table, search_table),
+        'CREATE TRIGGER IF NOT EXISTS %s_genres_ai AFTER INSERT ON genres WHEN new.%s IS NOT NULL BEGIN '
+        'UPDATE %s SET genres = %s WHERE rowid = new.%s; END'
+        % (search_table, genre_fk, search_table, genres.format(id='new.' + genre_fk), genre_fk),
+        'CREATE TRIGGER IF NOT EXISTS %s_genres_ad AFTER DELETE ON genres WHEN old.%s IS NOT NULL BEGIN '
+        'UPDATE %s SET genres = %s WHERE rowid = old.%s; END'
+        % (search_table, genre_fk, search_table, genres.format(id='old.' + genre_fk), genre_fk),
+        # Backfill the rows that existed before the triggers.
+        'INSERT INTO %s (rowid, name, city, genres) SELECT id, name, city, %s FROM "%s"'
+        % (search_table, genres.format(id='"%s".id' % table), table),
+    ]
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for name, table, column in TRGM_INDEXES:
+            op.create_index(name, table, [column], postgresql_using='gin',
+                            postgresql_ops={column: 'gin_trgm_ops'})
+    elif dialect == 'sqlite':
+        for table, search_table, genre_fk in SEARCH_TABLES:
+            for statement in sqlite_search_ddl(table, search_table, genre_fk):
+                op.execute(statement)
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        for name, table, column in TRGM_INDEXES:
+            op.drop_index(name, table_name=table)
+    elif dialect == 'sqlite':
+        for table, search_table, genre_fk in SEARCH_TABLES:
+            for suffix in ('ai', 'au', 'ad', 'genres_ai', 'genres_ad'):
+                op.execute('DROP TRIGGER IF EXISTS %s_%s' % (search_table, suffix))
+            op.execute('DROP TABLE IF EXISTS %s' % search_table)
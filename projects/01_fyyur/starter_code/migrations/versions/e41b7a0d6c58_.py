@@ -0,0 +1,123 @@
+"""normalize genres into a lookup table with association tables
+
+Revision ID: e41b7a0d6c58
+Revises: 9a3d5f0c8e21
+Create Date: 2026-10-18 12:25:53.904126
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e41b7a0d6c58'
+down_revision = '9a3d5f0c8e21'
+branch_labels = None
+depends_on = None
+
+
+# (owner table, association table, owner fk, SQLite search table)
+OWNERS = [
+    ('Venue', 'venue_genres', 'venue_id', 'venue_search'),
+    ('Artist', 'artist_genres', 'artist_id', 'artist_search'),
+]
+
+
+def sqlite_genre_triggers(search_table, table, genres_from, owner_column, genre_fk):
+    # Triggers refreshing the genres column of the SQLite search table when
+    # rows of `table` are inserted or deleted.
+    genres = "(SELECT group_concat(g.name, ' ') FROM %s WHERE %s = {id})" % (genres_from, owner_column)
+    return [
+        'CREATE TRIGGER %s_genres_ai AFTER INSERT ON %s BEGIN '
+        'UPDATE %s SET genres = %s WHERE rowid = new.%s; END'
+        % (search_table, table, search_table, genres.format(id='new.' + genre_fk), genre_fk),
+        'CREATE TRIGGER %s_genres_ad AFTER DELETE ON %s BEGIN '
+        'UPDATE %s SET genres = %s WHERE rowid = old.%s; END'
+        % (search_table, table, search_table, genres.format(id='old.' + genre_fk), genre_fk),
+    ]
+
+
+def drop_sqlite_genre_triggers():
+    for _, _, _, search_table in OWNERS:
+        op.execute('DROP TRIGGER IF EXISTS %s_genres_ai' % search_table)
+        op.execute('DROP TRIGGER IF EXISTS %s_genres_ad' % search_table)
+
+
+def upgrade():
+    sqlite = op.get_bind().dialect.name == 'sqlite'
+    if sqlite:
+        # the search triggers read genres.venue_id / genres.artist_id
+        drop_sqlite_genre_triggers()
+
+    op.create_table('venue_genres',
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('genre_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['genre_id'], ['genres.id'], ),
+    sa.ForeignKeyConstraint(['venue_id'], ['Venue.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('venue_id', 'genre_id')
+    )
+    op.create_index('ix_venue_genres_genre_id_venue_id', 'venue_genres', ['genre_id', 'venue_id'], unique=False)
+    op.create_table('artist_genres',
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('genre_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['Artist.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['genre_id'], ['genres.id'], ),
+    sa.PrimaryKeyConstraint('artist_id', 'genre_id')
+    )
+    op.create_index('ix_artist_genres_genre_id_artist_id', 'artist_genres', ['genre_id', 'artist_id'], unique=False)
+
+    # Point every listing at the lowest id carrying its genre name, then drop
+    # the duplicates.
+    for _, association, fk, _ in OWNERS:
+        op.execute(
+            'INSERT INTO {association} ({fk}, genre_id) '
+            'SELECT DISTINCT g.{fk}, c.id FROM genres g '
+            'JOIN (SELECT name, MIN(id) AS id FROM genres GROUP BY name) c ON c.name = g.name '
+            'WHERE g.{fk} IS NOT NULL'.format(association=association, fk=fk))
+    op.execute('DELETE FROM genres WHERE id NOT IN (SELECT MIN(id) FROM genres GROUP BY name)')
+
+    with op.batch_alter_table('genres') as batch_op:
+        batch_op.drop_index('ix_genres_venue_id')
+        batch_op.drop_index('ix_genres_artist_id')
+        batch_op.drop_column('venue_id')
+        batch_op.drop_column('artist_id')
+        batch_op.create_unique_constraint('uq_genres_name', ['name'])
+
+    if sqlite:
+        for _, association, fk, search_table in OWNERS:
+            genres_from = 'genres g JOIN %s a ON a.genre_id = g.id' % association
+            for statement in sqlite_genre_triggers(search_table, association, genres_from, 'a.' + fk, fk):
+                op.execute(statement)
+
+
+def downgrade():
+    sqlite = op.get_bind().dialect.name == 'sqlite'
+    if sqlite:
+        drop_sqlite_genre_triggers()
+
+    with op.batch_alter_table('genres') as batch_op:
+        batch_op.drop_constraint('uq_genres_name', type_='unique')
+        batch_op.add_column(sa.Column('artist_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('venue_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('genres_artist_id_fkey', 'Artist', ['artist_id'], ['id'])
+        batch_op.create_foreign_key('genres_venue_id_fkey', 'Venue', ['venue_id'], ['id'])
+        batch_op.create_index('ix_genres_artist_id', ['artist_id'], unique=False)
+        batch_op.create_index('ix_genres_venue_id', ['venue_id'], unique=False)
+
+    # Expand back to one genres row per listing and drop the shared rows.
+    for _, association, fk, _ in OWNERS:
+        op.execute(
+            'INSERT INTO genres (name, {fk}) '
+            'SELECT g.name, a.{fk} FROM {association} a JOIN genres g ON g.id = a.genre_id'
+            .format(association=association, fk=fk))
+    op.execute('DELETE FROM genres WHERE venue_id IS NULL AND artist_id IS NULL')
+
+    op.drop_index('ix_artist_genres_genre_id_artist_id', table_name='artist_genres')
+    op.drop_table('artist_genres')
+    op.drop_index('ix_venue_genres_genre_id_venue_id', table_name='venue_genres')
+    op.drop_table('venue_genres')
+
+    if sqlite:
+        for _, _, fk, search_table in OWNERS:
+            for statement in sqlite_genre_triggers(search_table, 'genres', 'genres g', 'g.' + fk, fk):
+                op.execute(statement)
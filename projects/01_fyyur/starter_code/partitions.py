@@ -0,0 +1,123 @@
+#----------------------------------------------------------------------------#
+# Monthly partitions of the shows table on PostgreSQL.
+#
+# The a6f0d3b9c217 migration turns shows into a table partitioned by range
+# of start_time, one partition per month (shows_YYYY_MM) plus shows_default
+# for anything outside them. Queries comparing start_time with a timestamp
+# only touch the matching months. create-show-partitions keeps partitions
+# ready ahead of time; archive-show-partitions detaches old months into the
+# archive schema. SQLite keeps a plain shows table.
+#----------------------------------------------------------------------------#
+
+import re
+from datetime import date
+
+from sqlalchemy import text
+
+PARTITION_NAME = re.compile(r'^shows_(\d{4})_(\d{2})$')
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_of(value):
+    return date(value.year, value.month, 1)
+
+
+def partition_name(month):
+    return 'shows_%04d_%02d' % (month.year, month.month)
+
+
+def is_partitioned(connection):
+    if connection.dialect.name != 'postgresql':
+        return False
+    return connection.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'shows'::regclass)")).scalar()
+
+
+def partition_months(connection):
+    """First days of the months that have a partition attached to shows."""
+    names = connection.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'shows'::regclass")).scalars()
+    months = []
+    for name in names:
+        match = PARTITION_NAME.match(name)
+        if match:
+            months.append(date(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(months)
+
+
+def has_default_partition(connection):
+    return connection.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'shows'::regclass AND c.relname = 'shows_default')")).scalar()
+
+
+def create_partitions(connection, today, ahead=3):
+    """Creates the missing partitions from this month to `ahead` months on.
+
+    Shows past the last partition land in shows_default, and PostgreSQL
+    refuses to create a partition for a range the default one holds rows
+    of. When it does, shows_default is detached, the new partitions are
+    created, their rows are moved out of shows_default into them, and it is
+    attached again, all in the caller's transaction. The DETACH lock keeps
+    other sessions waiting meanwhile, so none sees the moved shows missing.
+
+    Returns the names of the partitions created.
+    """
+    existing = set(partition_months(connection))
+    missing = []
+    month = month_of(today)
+    for _ in range(ahead + 1):
+        if month not in existing:
+            missing.append(month)
+        month = add_months(month, 1)
+    if not missing:
+        return []
+    move = has_default_partition(connection) and connection.execute(text(
+        'SELECT EXISTS (SELECT 1 FROM shows_default WHERE start_time >= :start AND start_time < :end)'),
+        {'start': missing[0], 'end': add_months(missing[-1], 1)}).scalar()
+    if move:
+        connection.execute(text('ALTER TABLE shows DETACH PARTITION shows_default'))
+    for month in missing:
+        bounds = {'start': month, 'end': add_months(month, 1)}
+        connection.execute(text(
+            "CREATE TABLE %s PARTITION OF shows FOR VALUES FROM ('%s') TO ('%s')"
+            % (partition_name(month), month.isoformat(), bounds['end'].isoformat())))
+        if move:
+            connection.execute(text(
+                'INSERT INTO %s (id, artist_id, venue_id, start_time) '
+                'SELECT id, artist_id, venue_id, start_time FROM shows_default '
+                'WHERE start_time >= :start AND start_time < :end' % partition_name(month)), bounds)
+            connection.execute(text(
+                'DELETE FROM shows_default WHERE start_time >= :start AND start_time < :end'), bounds)
+    if move:
+        connection.execute(text('ALTER TABLE shows ATTACH PARTITION shows_default DEFAULT'))
+    return [partition_name(month) for month in missing]
+
+
+def detach_partitions(connection, before, drop=False):
+    """Detaches the partitions of months before `before`.
+
+    They move to the archive schema, or are dropped with `drop`. Returns
+    (name, venue ids, artist ids) for each, so the caller can recount the
+    venues and artists that lost shows.
+    """
+    detached = []
+    if not drop:
+        connection.execute(text('CREATE SCHEMA IF NOT EXISTS archive'))
+    for month in partition_months(connection):
+        if month >= month_of(before):
+            break
+        name = partition_name(month)
+        owners = connection.execute(text('SELECT DISTINCT venue_id, artist_id FROM %s' % name)).all()
+        connection.execute(text('ALTER TABLE shows DETACH PARTITION %s' % name))
+        if drop:
+            connection.execute(text('DROP TABLE %s' % name))
+        else:
+            connection.execute(text('ALTER TABLE %s SET SCHEMA archive' % name))
+        detached.append((name, set(venue_id for venue_id, _ in owners), set(artist_id for _, artist_id in owners)))
+    return detached
@@ -0,0 +1,97 @@
+#----------------------------------------------------------------------------#
+# Connection pool settings and metrics for the fyyur engine.
+#----------------------------------------------------------------------------#
+
+import threading
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.pool import NullPool, QueuePool
+
+
+class MeteredPool(object):
+    """Pool mixin counting checkouts and the time spent waiting for them."""
+
+    def __init__(self, *args, **kwargs):
+        super(MeteredPool, self).__init__(*args, **kwargs)
+        self.metrics_lock = threading.Lock()
+        self.metrics = {
+            'checkouts': 0,
+            'checked_out': 0,
+            'timeouts': 0,
+            'wait_total_ms': 0.0,
+            'wait_max_ms': 0.0,
+        }
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super(MeteredPool, self)._do_get()
+        except exc.TimeoutError:
+            with self.metrics_lock:
+                self.metrics['timeouts'] += 1
+            raise
+        waited = (time.perf_counter() - start) * 1000
+        with self.metrics_lock:
+            self.metrics['checkouts'] += 1
+            self.metrics['checked_out'] += 1
+            self.metrics['wait_total_ms'] += waited
+            self.metrics['wait_max_ms'] = max(self.metrics['wait_max_ms'], waited)
+        return connection
+
+    def _do_return_conn(self, *args):
+        with self.metrics_lock:
+            self.metrics['checked_out'] -= 1
+        return super(MeteredPool, self)._do_return_conn(*args)
+
+
+class MeteredQueuePool(MeteredPool, QueuePool):
+    pass
+
+
+class MeteredNullPool(MeteredPool, NullPool):
+    pass
+
+
+def engine_options(database_uri, environ):
+    """SQLALCHEMY_ENGINE_OPTIONS built from DB_POOL_* environment variables.
+
+    DB_POOL=queue (default) keeps a QueuePool of DB_POOL_SIZE connections
+    plus DB_POOL_MAX_OVERFLOW extra ones; DB_POOL=null opens a connection
+    per checkout, for running behind PgBouncer in transaction mode. SQLite
+    keeps SQLAlchemy's own pool choice.
+    """
+    if database_uri.startswith('sqlite'):
+        return {}
+    options = {
+        'pool_pre_ping': environ.get('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes'),
+        'pool_recycle': int(environ.get('DB_POOL_RECYCLE', 1800)),
+    }
+    if environ.get('DB_POOL', 'queue') == 'null':
+        options['poolclass'] = MeteredNullPool
+    else:
+        options.update({
+            'poolclass': MeteredQueuePool,
+            'pool_size': int(environ.get('DB_POOL_SIZE', 5)),
+            'max_overflow': int(environ.get('DB_POOL_MAX_OVERFLOW', 10)),
+            'pool_timeout': float(environ.get('DB_POOL_TIMEOUT', 30)),
+        })
+    return options
+
+
+def pool_status(pool):
+    """Snapshot of a pool for the /internal/pool endpoint."""
+    status = {'pool': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update({
+            'size': pool.size(),
+            'checked_out': pool.checkedout(),
+            'idle': pool.checkedin(),
+            'overflow': pool.overflow(),
+        })
+    if isinstance(pool, MeteredPool):
+        with pool.metrics_lock:
+            metrics = dict(pool.metrics)
+        metrics['wait_avg_ms'] = metrics['wait_total_ms'] / metrics['checkouts'] if metrics['checkouts'] else 0.0
+        status.update(metrics)
+    return status
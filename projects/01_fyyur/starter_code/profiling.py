@@ -0,0 +1,127 @@
+#----------------------------------------------------------------------------#
+# Per-request SQL profiling.
+#
+# Counts the statements a request sends to any engine, the time spent in
+# them and how often each statement shape repeats. Only with SQL_PROFILING
+# on, which it is not by default: then every response gets a Server-Timing
+# header, and a request going over its query budget, or repeating one
+# statement shape (the N+1 pattern), is logged as a warning.
+#----------------------------------------------------------------------------#
+
+import logging
+import re
+import time
+from collections import Counter
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+log = logging.getLogger(__name__)
+
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+PLACEHOLDER_LISTS = re.compile(r'\((?:\s*(?:\?|%\(\w+\)s|%s|:\w+)\s*,)+\s*(?:\?|%\(\w+\)s|%s|:\w+)\s*\)')
+WHITESPACE = re.compile(r'\s+')
+
+
+def fingerprint(statement):
+    """Statement with literals and IN lists collapsed, so that the queries
+    of an N+1 loop share one fingerprint."""
+    statement = LITERALS.sub('?', statement)
+    statement = PLACEHOLDER_LISTS.sub('(?)', statement)
+    return WHITESPACE.sub(' ', statement).strip()
+
+
+class RequestProfile(object):
+
+    def __init__(self):
+        self.queries = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def repeated(self, threshold):
+        return [(statement, count) for statement, count in self.fingerprints.most_common()
+                if count >= threshold]
+
+
+class QueryProfiler(object):
+    """Flask extension recording a RequestProfile for every request.
+
+    Configured by SQL_PROFILING (off unless set; read per request, the
+    engine listeners are installed by the first profiled request),
+    SQL_QUERY_BUDGET (statements per
+    request before warning) and SQL_REPEAT_THRESHOLD (repetitions of one
+    statement shape reported as N+1). Views needing more statements can
+    raise their own budget with @query_budget(n).
+    """
+
+    def __init__(self, app=None):
+        self.listening = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        budget = app.config.get('SQL_QUERY_BUDGET', 20)
+        threshold = app.config.get('SQL_REPEAT_THRESHOLD', 5)
+
+        @app.before_request
+        def start_profile():
+            if not app.config.get('SQL_PROFILING', False):
+                return
+            self.listen()
+            g.sql_profile = RequestProfile()
+
+        @app.after_request
+        def report_profile(response):
+            profile = g.get('sql_profile')
+            if profile is None:
+                return response
+            response.headers.add('Server-Timing', 'db;dur=%.1f;desc="%d queries"' % (
+                profile.duration * 1000, profile.queries))
+            view = app.view_functions.get(request.endpoint)
+            limit = getattr(view, 'query_budget', budget)
+            if profile.queries > limit:
+                log.warning('%s %s ran %d queries (budget %d) in %.1fms', request.method, request.path,
+                            profile.queries, limit, profile.duration * 1000)
+            for statement, count in profile.repeated(threshold):
+                log.warning('%s %s repeated a query %d times (N+1?): %s', request.method, request.path,
+                            count, statement)
+            return response
+
+    def listen(self):
+        if self.listening:
+            return
+        event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+        event.listen(Engine, 'handle_error', handle_error)
+        self.listening = True
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'sql_profile' in g:
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('query_start')
+    if not starts or not has_request_context() or 'sql_profile' not in g:
+        return
+    profile = g.sql_profile
+    profile.queries += 1
+    profile.duration += time.perf_counter() - starts.pop()
+    profile.fingerprints[fingerprint(statement)] += 1
+
+
+def handle_error(exception_context):
+    # a failed statement never reaches after_cursor_execute
+    connection = exception_context.connection
+    if connection is not None and connection.info.get('query_start'):
+        connection.info['query_start'].pop()
+
+
+def query_budget(queries):
+    """Raises the query budget of one view above SQL_QUERY_BUDGET."""
+    def decorator(view):
+        view.query_budget = queries
+        return view
+    return decorator
@@ -0,0 +1,159 @@
+#----------------------------------------------------------------------------#
+# Read-replica routing for the fyyur session.
+#
+# Read-only requests (GET/HEAD and views marked with @read_only) pick one
+# replica at the start of the request, round-robin, and every SELECT of that
+# request runs on it. Writes, and every statement after the session's first
+# flush, go to the primary. A client that just wrote keeps reading from the
+# primary for REPLICA_STICKY_SECONDS so it sees its own changes despite
+# replication lag; the page cache reads a page from the primary too when it
+# misses it within that window of the page's invalidation, so another client
+# cannot cache the replica's old rows. A replica that fails with an
+# OperationalError is skipped for a while, and the read that hit the failure
+# is retried on the primary.
+#----------------------------------------------------------------------------#
+
+import itertools
+import logging
+import threading
+import time
+
+from flask import g, has_request_context, request, session
+from sqlalchemy import create_engine, event, orm
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.sql import Delete, Insert, Update
+
+try:
+    from flask_sqlalchemy.session import Session as FlaskSession
+except ImportError:
+    # Flask-SQLAlchemy 2.x
+    from flask_sqlalchemy import SignallingSession as FlaskSession
+from flask_sqlalchemy import SQLAlchemy
+
+log = logging.getLogger(__name__)
+
+
+class RoutingSession(FlaskSession):
+    """Session sending the SELECTs of a read-only request to its replica."""
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        engine = g.get('read_engine') if has_request_context() else None
+        if engine is not None and not self._flushing and not self.info.get('wrote') \
+                and not isinstance(clause, (Insert, Update, Delete)):
+            return engine
+        return super(RoutingSession, self).get_bind(mapper=mapper, clause=clause, **kwargs)
+
+    def execute(self, *args, **kwargs):
+        try:
+            return super(RoutingSession, self).execute(*args, **kwargs)
+        except OperationalError:
+            # the replica went away (ReplicaRouter has marked it down); a
+            # request that has not written can start over on the primary
+            if not has_request_context() or g.get('read_engine') is None or self.info.get('wrote'):
+                raise
+            g.read_engine = None
+            self.rollback()
+            return super(RoutingSession, self).execute(*args, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def after_flush(session_, flush_context):
+    # read-after-write in the same request stays on the primary
+    session_.info['wrote'] = True
+    if has_request_context():
+        g.wrote = True
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """SQLAlchemy extension whose session is a RoutingSession."""
+
+    def __init__(self, app=None, **kwargs):
+        kwargs.setdefault('session_options', {})['class_'] = RoutingSession
+        super(RoutingSQLAlchemy, self).__init__(app, **kwargs)
+
+    def create_session(self, options):
+        # Flask-SQLAlchemy 2.x; 3.x takes the class from session_options
+        return orm.sessionmaker(db=self, **options)
+
+
+class ReplicaRouter(object):
+    """Round-robin over the replica engines, skipping unreachable ones.
+
+    Replicas are not probed before use: one whose connection or statement
+    fails with an OperationalError is left out for `cooldown` seconds from
+    then on; with no replica available, reads use the primary.
+    """
+
+    def __init__(self, engine_options=None, cooldown=30):
+        self.engine_options = engine_options or (lambda uri: {})
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+        self.configure([])
+
+    def configure(self, uris):
+        with self.lock:
+            for engine in getattr(self, 'engines', []):
+                engine.dispose()
+            self.engines = [create_engine(uri, **self.engine_options(uri)) for uri in uris]
+            for engine in self.engines:
+                event.listen(engine, 'handle_error', self.replica_failed)
+            self.turn = itertools.cycle(range(len(self.engines)))
+            self.down_until = {}
+            self.reads = dict((engine, 0) for engine in self.engines)
+
+    def init_app(self, app):
+        self.configure(app.config.get('SQLALCHEMY_REPLICA_URIS', []))
+        sticky = app.config.get('REPLICA_STICKY_SECONDS', 5)
+
+        @app.before_request
+        def choose_read_engine():
+            view = app.view_functions.get(request.endpoint)
+            if request.method not in ('GET', 'HEAD') and not getattr(view, 'read_only', False):
+                return
+            if session.get('primary_until', 0) > time.time():
+                return
+            g.read_engine = self.choose()
+
+        @app.after_request
+        def stick_to_primary(response):
+            if g.get('wrote'):
+                session['primary_until'] = time.time() + sticky
+            return response
+
+    def use_primary(self):
+        """Sends the rest of this request's reads to the primary."""
+        g.pop('read_engine', None)
+
+    def choose(self):
+        now = time.time()
+        for _ in range(len(self.engines)):
+            with self.lock:
+                engine = self.engines[next(self.turn)]
+                if self.down_until.get(engine, 0) > now:
+                    continue
+                self.reads[engine] += 1
+            return engine
+        return None
+
+    def replica_failed(self, context):
+        # handle_error hook of the replica engines, for failed connections
+        # as well as statements
+        if isinstance(context.sqlalchemy_exception, OperationalError):
+            log.warning('Replica %r unavailable, skipping it for %ss',
+                        context.engine.url, self.cooldown, exc_info=context.original_exception)
+            self.down_until[context.engine] = time.time() + self.cooldown
+
+    def status(self, pool_status):
+        """Pool snapshot and reads served per replica, for /internal/pool."""
+        now = time.time()
+        return dict((repr(engine.url), dict(
+            pool_status(engine.pool),
+            reads=self.reads[engine],
+            available=self.down_until.get(engine, 0) <= now,
+        )) for engine in self.engines)
+
+
+def read_only(view):
+    """Marks a non-GET view as safe to serve from a replica (e.g. search forms)."""
+    view.read_only = True
+    return view
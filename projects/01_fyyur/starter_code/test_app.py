@@ -0,0 +1,665 @@
+import csv
+import gzip
+import importlib.util
+import io
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import unittest
+from datetime import date, datetime, timedelta
+
+os.environ['DATABASE_URL'] = 'sqlite://'
+
+from flask import g
+from sqlalchemy import event
+
+import partitions
+from cache import NullCache, RedisCache
+from profiling import fingerprint
+from app import app, db, count_queries, venue_detail, artist_detail, show_listing, \
+    async_db, venue_detail_async, artist_detail_async, roll_over_shows, show_count_drift, calendar_listing, \
+    search_with_upcoming_shows, venue_directory, genres_named, genre_id, genre_id_cache, page_cache, Venue, Artist, Show, Genre, \
+    venue_genres, artist_genres, replicas, listing_page
+
+
+class FyyurTestCase(unittest.TestCase):
+    """This class represents the fyyur test case"""
+
+    def setUp(self):
+        """Define test variables and seed a small in-memory database."""
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False
+        self.client = app.test_client
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        self.now = datetime.now()
+        venue = Venue(name='The Musical Hop', city='San Francisco', state='CA',
+                      genres=genres_named(['Jazz', 'Swing']))
+        db.session.add(venue)
+        artist = Artist(name='Guns N Petals', city='San Francisco', state='CA',
+                        genres=genres_named(['Rock n Roll']))
+        db.session.add(artist)
+        other_artist = Artist(name='The Wild Sax Band', city='San Francisco', state='CA',
+                              genres=genres_named(['Jazz']))
+        db.session.add(other_artist)
+        db.session.flush()
+        for days in (-3, -2, 1, 2, 5):
+            db.session.add(Show(venue_id=venue.id, artist_id=artist.id,
+                                start_time=self.now + timedelta(days=days)))
+        db.session.add(Show(venue_id=venue.id, artist_id=other_artist.id,
+                            start_time=self.now + timedelta(days=3)))
+        db.session.commit()
+        self.venue_id = venue.id
+        self.artist_id = artist.id
+        db.session.remove()
+
+    def tearDown(self):
+        """Executed after each test"""
+        db.session.remove()
+        db.drop_all()
+        genre_id_cache.clear()
+        page_cache.clear()
+        self.ctx.pop()
+
+    def test_venue_detail_partitions_shows(self):
+        venue = venue_detail(self.venue_id, now=self.now)
+        self.assertEqual(sorted(venue['genres']), ['Jazz', 'Swing'])
+        self.assertEqual(venue['past_shows_count'], 2)
+        self.assertEqual(venue['upcoming_shows_count'], 4)
+        self.assertEqual(venue['upcoming_shows'][0]['artist_name'], 'Guns N Petals')
+        self.assertEqual(venue['upcoming_shows'][2]['artist_name'], 'The Wild Sax Band')
+
+    def test_artist_detail_partitions_shows(self):
+        artist = artist_detail(self.artist_id, now=self.now)
+        self.assertEqual(artist['genres'], ['Rock n Roll'])
+        self.assertEqual(artist['past_shows_count'], 2)
+        self.assertEqual(artist['upcoming_shows_count'], 3)
+        self.assertEqual(artist['past_shows'][0]['venue_name'], 'The Musical Hop')
+
+    def test_detail_pages_use_two_statements(self):
+        with count_queries() as counter:
+            venue_detail(self.venue_id)
+        self.assertEqual(counter['queries'], 2)
+        db.session.remove()
+        with count_queries() as counter:
+            artist_detail(self.artist_id)
+        self.assertEqual(counter['queries'], 2)
+
+    @unittest.skipUnless(importlib.util.find_spec('aiosqlite') and importlib.util.find_spec('greenlet'),
+                         'needs aiosqlite and greenlet')
+    def test_async_detail_matches_sync_detail(self):
+        handle, path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        connection = db.engine.raw_connection()
+        try:
+            copy = sqlite3.connect(path)
+            connection.driver_connection.backup(copy)
+            copy.close()
+        finally:
+            connection.close()
+        async_db.configure('sqlite+aiosqlite:///' + path)
+        try:
+            venue = venue_detail(self.venue_id, now=self.now)
+            venue['genres'].sort()
+            self.assertEqual(async_db.run(venue_detail_async(self.venue_id, now=self.now)), venue)
+            self.assertEqual(async_db.run(artist_detail_async(self.artist_id, now=self.now)),
+                             artist_detail(self.artist_id, now=self.now))
+            self.assertIsNone(async_db.run(venue_detail_async(1000)))
+        finally:
+            async_db.configure(None)
+            os.remove(path)
+
+    def test_unknown_venue_returns_404(self):
+        res = self.client().get('/venues/1000')
+        self.assertEqual(res.status_code, 404)
+
+    def test_show_artist_page(self):
+        res = self.client().get('/artists/%d' % self.artist_id)
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'Guns N Petals', res.data)
+
+    def test_genres_are_shared(self):
+        self.assertEqual(Genre.query.filter_by(name='Jazz').count(), 1)
+
+    def test_genre_id_cache_forgets_rolled_back_genres(self):
+        db.session.add(Genre(name='Polka'))
+        db.session.flush()
+        self.assertIsNotNone(genre_id('Polka'))
+        db.session.rollback()
+        self.assertIsNone(genre_id('Polka'))
+        self.assertIsNotNone(genre_id('Jazz'))
+
+    def test_import_shows_rejects_non_numeric_ids(self):
+        start_time = (self.now + timedelta(days=10)).strftime('%Y-%m-%d %H:%M:%S')
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as source:
+            source.write('venue_id,artist_id,start_time\n')
+            source.write('%d,%d,%s\n' % (self.venue_id, self.artist_id, start_time))
+            source.write('%d,one,%s\n' % (self.venue_id, start_time))
+            source.write('%d,%d,%s\n' % (self.venue_id, self.artist_id + 100, start_time))
+        try:
+            result = app.test_cli_runner().invoke(args=['import-listings', 'shows', source.name])
+        finally:
+            os.remove(source.name)
+        self.assertIn('line 3: venue_id and artist_id must be integers', result.output)
+        self.assertIn('line 4: unknown venue_id or artist_id', result.output)
+        self.assertIn('1 shows imported, 2 rejected', result.output)
+        self.assertEqual(Show.query.count(), 7)
+        self.assertEqual(genres_named(['Jazz', 'Blues'])[0].id, Genre.query.filter_by(name='Jazz').one().id)
+
+    def test_browse_by_genre(self):
+        areas = venue_directory(genre='Jazz')
+        self.assertEqual([venue['name'] for venue in areas[0]['venues']], ['The Musical Hop'])
+        self.assertEqual(venue_directory(genre='Polka'), [])
+        res = self.client().get('/artists?genre=Jazz')
+        self.assertIn(b'The Wild Sax Band', res.data)
+        self.assertNotIn(b'Guns N Petals', res.data)
+
+    def test_pages_are_cached_until_a_commit(self):
+        url = '/venues/%d' % self.venue_id
+        self.client().get(url)
+        self.client().get(url)
+        self.assertEqual(page_cache.stats()['hits'], 1)
+        db.session.add(Show(venue_id=self.venue_id, artist_id=self.artist_id,
+                            start_time=self.now + timedelta(days=30)))
+        db.session.commit()
+        res = self.client().get(url)
+        self.assertEqual(page_cache.stats()['misses'], 2)
+        self.assertIn(b'5 Upcoming Shows', res.data)
+
+    def test_cache_stats_endpoint(self):
+        self.client().get('/shows')
+        res = self.client().get('/internal/cache')
+        self.assertEqual(res.get_json()['misses'], 1)
+
+    def test_internal_endpoints_need_debug_or_the_token(self):
+        app.config['DEBUG'] = False
+        try:
+            app.config['INTERNAL_TOKEN'] = None
+            for url in ('/internal/cache', '/internal/pool'):
+                self.assertEqual(self.client().get(url).status_code, 404)
+            app.config['INTERNAL_TOKEN'] = 'secret'
+            for url in ('/internal/cache', '/internal/pool'):
+                res = self.client().get(url, headers={'X-Internal-Token': 'wrong'})
+                self.assertEqual(res.status_code, 404)
+                res = self.client().get(url, headers={'X-Internal-Token': 'secret'})
+                self.assertEqual(res.status_code, 200)
+        finally:
+            app.config['DEBUG'] = True
+            app.config['INTERNAL_TOKEN'] = None
+
+    def test_redis_cache_backend(self):
+        # the part of the redis-py client RedisCache uses, over a dict
+        class Client(object):
+            def __init__(self):
+                self.values = {}
+
+            def get(self, key):
+                return self.values.get(key)
+
+            def setex(self, key, ttl, value):
+                self.values[key] = value
+
+            def incr(self, key):
+                self.values[key] = str(int(self.values.get(key, b'0')) + 1).encode('utf-8')
+                return int(self.values[key])
+
+            def scan_iter(self, pattern):
+                return [key for key in list(self.values) if key.startswith(pattern.rstrip('*'))]
+
+            def delete(self, key):
+                self.values.pop(key, None)
+
+        client = Client()
+        client.setex('other:key', 60, b'kept')
+        backend, page_cache.backend = page_cache.backend, RedisCache(client)
+        try:
+            page_cache.clear()
+            first = self.client().get('/venues').data
+            self.assertEqual(self.client().get('/venues').data, first)
+            self.assertEqual((page_cache.hits, page_cache.misses), (1, 1))
+            self.assertTrue(any(key.startswith('fyyur:page:/venues') for key in client.values))
+            db.session.get(Venue, self.venue_id).name = 'Renamed Hall'
+            db.session.commit()
+            self.assertEqual(client.values['fyyur:generation:venues'], b'1')
+            self.assertIn(b'Renamed Hall', self.client().get('/venues').data)
+            page_cache.clear()
+            self.assertEqual(list(client.values), ['other:key'])
+        finally:
+            page_cache.backend = backend
+
+    def show_counts(self):
+        venue = db.session.get(Venue, self.venue_id)
+        artist = db.session.get(Artist, self.artist_id)
+        counts = (venue.upcoming_shows_count, venue.past_shows_count,
+                  artist.upcoming_shows_count, artist.past_shows_count)
+        db.session.remove()
+        return counts
+
+    def test_show_counts_follow_inserts_and_deletes(self):
+        self.assertEqual(self.show_counts(), (4, 2, 3, 2))
+        db.session.add(Show(venue_id=self.venue_id, artist_id=self.artist_id,
+                            start_time=self.now + timedelta(days=10)))
+        db.session.delete(Show.query.order_by(Show.start_time).first())
+        db.session.commit()
+        self.assertEqual(self.show_counts(), (5, 1, 4, 1))
+        self.assertEqual(show_count_drift(Venue) + show_count_drift(Artist), [])
+
+    def test_roll_over_moves_started_shows(self):
+        self.assertEqual(roll_over_shows(now=self.now + timedelta(days=1, hours=12)), 1)
+        self.assertEqual(self.show_counts(), (3, 3, 2, 3))
+        self.assertEqual(roll_over_shows(now=self.now + timedelta(days=1, hours=12)), 0)
+        self.assertEqual(venue_directory()[0]['venues'][0]['num_upcoming_shows'], 3)
+
+    def test_roll_over_refreshes_artist_api(self):
+        # starts after the watermark and before the roll over
+        db.session.add(Show(venue_id=self.venue_id, artist_id=self.artist_id, start_time=datetime.now()))
+        db.session.commit()
+        url = '/api/v1/artists?fields=id,upcoming_shows_count,past_shows_count'
+        before = self.client().get(url).get_json()['data'][0]
+        result = app.test_cli_runner().invoke(args=['roll-over-shows'])
+        self.assertIn('1 shows rolled over', result.output)
+        after = self.client().get(url).get_json()['data'][0]
+        self.assertEqual(after['id'], self.artist_id)
+        self.assertEqual(after['upcoming_shows_count'], before['upcoming_shows_count'] - 1)
+        self.assertEqual(after['past_shows_count'], before['past_shows_count'] + 1)
+
+    def test_cli_invalidation_warns_with_a_per_process_cache(self):
+        result = app.test_cli_runner().invoke(args=['refresh-show-calendar'])
+        self.assertIn('CACHE_TYPE=lru is per process', result.stderr)
+        backend, page_cache.backend = page_cache.backend, NullCache()
+        try:
+            result = app.test_cli_runner().invoke(args=['refresh-show-calendar'])
+        finally:
+            page_cache.backend = backend
+        self.assertIn('shows in the calendar', result.output)
+        self.assertEqual(result.stderr, '')
+
+    def test_check_show_counts(self):
+        db.session.execute(Venue.__table__.update().values(upcoming_shows_count=99))
+        db.session.commit()
+        result = app.test_cli_runner().invoke(args=['check-show-counts'])
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn('Venue %d: upcoming 99 (actual 4), past 2 (actual 2)' % self.venue_id, result.output)
+        result = app.test_cli_runner().invoke(args=['check-show-counts', '--fix'])
+        self.assertIn('1 rows drifted, fixed', result.output)
+        result = app.test_cli_runner().invoke(args=['check-show-counts'])
+        self.assertEqual(result.exit_code, 0)
+
+    def test_calendar_listing_by_city_and_dates(self):
+        other = Venue(name='Park Square', city='New York', state='NY')
+        db.session.add(other)
+        db.session.flush()
+        db.session.add(Show(venue_id=other.id, artist_id=self.artist_id,
+                            start_time=self.now + timedelta(days=1)))
+        db.session.commit()
+        today = self.now.date()
+        listing = calendar_listing('San Francisco', 'CA', today + timedelta(days=1), today + timedelta(days=3))
+        self.assertEqual([show['start_time'] for show in listing['shows']],
+                         [self.now + timedelta(days=days) for days in (1, 2, 3)])
+        first = calendar_listing('San Francisco', start=today - timedelta(days=7), per_page=4)
+        rest = calendar_listing('San Francisco', start=today - timedelta(days=7), after=first['next'])
+        self.assertEqual(len(first['shows']) + len(rest['shows']), 6)
+        self.assertIsNone(rest['next'])
+        self.assertEqual(len(calendar_listing('New York')['shows']), 1)
+
+    def test_calendar_follows_venue_changes(self):
+        venue = db.session.get(Venue, self.venue_id)
+        venue.city = 'Oakland'
+        db.session.commit()
+        self.assertEqual(calendar_listing('San Francisco')['shows'], [])
+        res = self.client().get('/shows?city=Oakland&state=CA&from=%s' % (self.now - timedelta(days=7)).date())
+        self.assertEqual(res.data.count(b'playing at'), 6)
+        self.assertEqual(self.client().get('/shows?city=Oakland&from=tomorrow').status_code, 400)
+        db.session.delete(Show.query.first())
+        db.session.commit()
+        self.assertEqual(len(calendar_listing('Oakland', start=self.now.date() - timedelta(days=7))['shows']), 5)
+
+    def test_show_partitions_are_postgres_only(self):
+        result = app.test_cli_runner().invoke(args=['archive-show-partitions', '--before', '2020-01'])
+        self.assertIn('shows is not partitioned', result.output)
+        self.assertEqual(partitions.add_months(date(2026, 11, 1), 3), date(2027, 2, 1))
+        self.assertEqual(partitions.partition_name(partitions.add_months(date(2027, 1, 1), -1)), 'shows_2026_12')
+
+    def test_new_partition_takes_rows_from_default(self):
+        # a show in shows_default for a month that gets its partition, as
+        # PostgreSQL would answer the catalog queries
+        class Result(object):
+            def __init__(self, value):
+                self.value = value
+
+            def scalar(self):
+                return self.value
+
+            def scalars(self):
+                return iter(self.value)
+
+        class Connection(object):
+            def __init__(self):
+                self.statements = []
+
+            def execute(self, statement, params=None):
+                sql = str(statement)
+                self.statements.append(sql)
+                if 'pg_inherits' in sql and 'shows_default' not in sql:
+                    return Result(['shows_default', 'shows_2026_10', 'shows_2026_11'])
+                return Result(True)
+
+        connection = Connection()
+        created = partitions.create_partitions(connection, date(2026, 10, 18), ahead=2)
+        self.assertEqual(created, ['shows_2026_12'])
+        ddl = [sql.split(' WHERE')[0] for sql in connection.statements if not sql.startswith('SELECT')]
+        self.assertEqual(ddl, [
+            'ALTER TABLE shows DETACH PARTITION shows_default',
+            "CREATE TABLE shows_2026_12 PARTITION OF shows FOR VALUES FROM ('2026-12-01') TO ('2027-01-01')",
+            'INSERT INTO shows_2026_12 (id, artist_id, venue_id, start_time) '
+            'SELECT id, artist_id, venue_id, start_time FROM shows_default',
+            'DELETE FROM shows_default',
+            'ALTER TABLE shows ATTACH PARTITION shows_default DEFAULT',
+        ])
+
+    def test_server_timing_header(self):
+        res = self.client().get('/venues/%d' % self.venue_id)
+        self.assertNotIn('Server-Timing', res.headers)
+        page_cache.clear()
+        app.config['SQL_PROFILING'] = True
+        try:
+            res = self.client().get('/venues/%d' % self.venue_id)
+            self.assertRegex(res.headers['Server-Timing'], r'^db;dur=[0-9.]+;desc="2 queries"$')
+            res = self.client().get('/venues/%d' % self.venue_id)
+            self.assertIn('desc="0 queries"', res.headers['Server-Timing'])
+        finally:
+            app.config['SQL_PROFILING'] = False
+
+    def test_fingerprint_groups_n_plus_one_queries(self):
+        self.assertEqual(
+            fingerprint('SELECT * FROM shows WHERE venue_id = 12 AND name = \'it\'\'s\''),
+            fingerprint('SELECT *\n  FROM shows WHERE venue_id = 7 AND name = \'x\''))
+        self.assertEqual(fingerprint('SELECT 1 FROM genres WHERE id IN (?, ?, ?)'),
+                         'SELECT ? FROM genres WHERE id IN (?)')
+
+    def test_import_listings(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as source:
+            source.write('name,city,state,address,genres,facebook_link\n')
+            source.write('Park Square,San Francisco,CA,34 Whiskey Moore Ave,Jazz;Folk,https://facebook.com/psl\n')
+            source.write('Nowhere,,XX,,Jazz,not a url\n')
+        try:
+            result = app.test_cli_runner().invoke(args=['import-listings', 'venues', source.name])
+        finally:
+            os.remove(source.name)
+        self.assertIn('1 venues imported, 1 rejected', result.output)
+        venue = Venue.query.filter_by(name='Park Square').one()
+        self.assertEqual(sorted(genre.name for genre in venue.genres), ['Folk', 'Jazz'])
+        self.assertEqual(Genre.query.filter_by(name='Jazz').count(), 1)
+
+    def test_api_lists_page_with_cursors_and_sparse_fields(self):
+        res = self.client().get('/api/v1/artists?fields=name,genres')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.get_json()['data'], [
+            {'name': 'Guns N Petals', 'genres': ['Rock n Roll']},
+            {'name': 'The Wild Sax Band', 'genres': ['Jazz']}])
+        self.assertIsNone(res.get_json()['next'])
+
+        first = listing_page(Artist, ['id'], per_page=1)
+        self.assertEqual(first['data'], [{'id': self.artist_id}])
+        second = listing_page(Artist, ['id'], after=first['next'], per_page=1)
+        self.assertNotEqual(second['data'], first['data'])
+        self.assertIsNone(second['next'])
+
+        venues = self.client().get('/api/v1/venues?genre=Swing').get_json()['data']
+        self.assertEqual(venues[0]['upcoming_shows_count'], 4)
+        self.assertEqual(self.client().get('/api/v1/venues?fields=name,rating').status_code, 400)
+        self.assertEqual(self.client().get('/api/v1/venues?after=nope').status_code, 400)
+
+        shows = self.client().get('/api/v1/shows?when=upcoming&fields=id,start_time').get_json()['data']
+        self.assertEqual(len(shows), 4)
+        self.assertEqual(set(shows[0]), {'id', 'start_time'})
+
+    def test_api_detail_etags(self):
+        url = '/api/v1/venues/%d?fields=name,upcoming_shows' % self.venue_id
+        res = self.client().get(url)
+        venue = res.get_json()
+        self.assertEqual(venue['name'], 'The Musical Hop')
+        self.assertEqual(len(venue['upcoming_shows']), 4)
+        etag = res.headers['ETag']
+        res = self.client().get(url, headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.data, b'')
+        db.session.add(Show(venue_id=self.venue_id, artist_id=self.artist_id,
+                            start_time=self.now + timedelta(days=30)))
+        db.session.commit()
+        res = self.client().get(url, headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+        self.assertEqual(self.client().get('/api/v1/artists/1000').status_code, 404)
+
+    def test_export_streams_csv_and_jsonl(self):
+        res = self.client().get('/export/venues.csv')
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.is_streamed)
+        rows = list(csv.DictReader(io.StringIO(res.get_data(as_text=True))))
+        self.assertEqual([row['name'] for row in rows], ['The Musical Hop'])
+        self.assertEqual(sorted(rows[0]['genres'].split(';')), ['Jazz', 'Swing'])
+
+        res = self.client().get('/export/shows.jsonl.gz')
+        self.assertEqual(res.mimetype, 'application/gzip')
+        shows = [json.loads(line) for line in gzip.decompress(res.data).decode('utf-8').splitlines()]
+        self.assertEqual(len(shows), 6)
+        self.assertEqual(set(shows[0]), {'id', 'venue_id', 'artist_id', 'start_time'})
+
+        res = self.client().get('/export/artists.jsonl', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        artists = [json.loads(line) for line in gzip.decompress(res.data).decode('utf-8').splitlines()]
+        self.assertEqual([artist['genres'] for artist in artists], [['Rock n Roll'], ['Jazz']])
+
+        self.assertEqual(self.client().get('/export/genres.csv').status_code, 404)
+
+    def test_export_listings_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'shows.csv.gz')
+            result = app.test_cli_runner().invoke(args=['export-listings', 'shows', path, '--batch-size', '2'])
+            self.assertEqual(result.exit_code, 0, result.output)
+            with gzip.open(path, 'rt') as dump:
+                rows = list(csv.DictReader(dump))
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(sorted(int(row['id']) for row in rows), [int(row['id']) for row in rows])
+
+    def test_show_listing_keyset_pages(self):
+        first = show_listing(per_page=4, now=self.now)
+        self.assertEqual(len(first['shows']), 4)
+        second = show_listing(after=first['next'], per_page=4, now=self.now)
+        self.assertEqual(len(second['shows']), 2)
+        self.assertIsNone(second['next'])
+        start_times = [show['start_time'] for show in first['shows'] + second['shows']]
+        self.assertEqual(start_times, sorted(start_times, reverse=True))
+
+    def test_show_listing_filters(self):
+        upcoming = show_listing('upcoming', now=self.now)['shows']
+        past = show_listing('past', now=self.now)['shows']
+        self.assertEqual((len(upcoming), len(past)), (4, 2))
+        self.assertEqual(upcoming[-1]['artist_name'], 'Guns N Petals')
+        with count_queries() as counter:
+            show_listing()
+        self.assertEqual(counter['queries'], 1)
+
+    def test_shows_rejects_bad_cursor(self):
+        res = self.client().get('/shows?after=nonsense')
+        self.assertEqual(res.status_code, 400)
+
+
+
+class ReplicaTestCase(unittest.TestCase):
+    """Read-only requests go to a replica, here a second SQLite file"""
+
+    def setUp(self):
+        """Give the replica a venue the primary does not have."""
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+        handle, self.replica_path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        replicas.configure(['sqlite:///' + self.replica_path])
+        db.metadata.create_all(replicas.engines[0])
+        with replicas.engines[0].begin() as connection:
+            connection.execute(Venue.__table__.insert(), [
+                {'name': 'Replica Hall', 'city': 'San Francisco', 'state': 'CA'}])
+
+    def tearDown(self):
+        """Executed after each test"""
+        replicas.configure([])
+        os.remove(self.replica_path)
+        db.session.remove()
+        db.drop_all()
+        genre_id_cache.clear()
+        page_cache.clear()
+        self.ctx.pop()
+
+    def test_reads_use_the_replica(self):
+        self.assertIn(b'Replica Hall', self.client.get('/venues').data)
+        res = self.client.post('/venues/search', data={'search_term': 'Replica'})
+        self.assertIn(b'Replica Hall', res.data)
+
+    def test_writes_and_following_reads_use_the_primary(self):
+        self.client.post('/venues/create', data={
+            'name': 'Primary Lounge', 'city': 'San Francisco', 'state': 'CA',
+            'address': '1 Main St', 'genres': 'Jazz', 'facebook_link': 'https://facebook.com/pl'})
+        self.assertEqual([venue.name for venue in Venue.query.all()], ['Primary Lounge'])
+        res = self.client.get('/venues')
+        self.assertIn(b'Primary Lounge', res.data)
+        self.assertNotIn(b'Replica Hall', res.data)
+
+    def test_reads_do_not_probe_the_replica(self):
+        checkouts = []
+        event.listen(replicas.engines[0], 'checkout', lambda *args: checkouts.append(args))
+        self.client.get('/venues')
+        self.assertEqual(len(checkouts), 1)
+
+    def test_invalidated_pages_are_not_cached_from_a_lagging_replica(self):
+        self.assertIn(b'Replica Hall', self.client.get('/venues').data)
+        self.client.post('/venues/create', data={
+            'name': 'Primary Lounge', 'city': 'San Francisco', 'state': 'CA',
+            'address': '1 Main St', 'genres': 'Jazz', 'facebook_link': 'https://facebook.com/pl'})
+        # the requests share this test's app context: drop the write's session
+        # and its g.wrote, which would keep the other client on the primary
+        db.session.remove()
+        g.pop('wrote', None)
+        # another client, not sticky to the primary, misses the invalidated page
+        other = app.test_client()
+        res = other.get('/venues')
+        self.assertIn(b'Primary Lounge', res.data)
+        self.assertNotIn(b'Replica Hall', res.data)
+        self.assertIn(b'Primary Lounge', other.get('/venues').data)
+        # once the replica catches up and the window is over it serves the page
+        with replicas.engines[0].begin() as connection:
+            connection.execute(Venue.__table__.insert(), [
+                {'name': 'Primary Lounge', 'city': 'San Francisco', 'state': 'CA'}])
+        page_cache.clear()
+        res = other.get('/venues')
+        self.assertIn(b'Primary Lounge', res.data)
+        self.assertIn(b'Replica Hall', res.data)
+
+    def test_unreachable_replica_falls_back_to_the_primary(self):
+        replicas.configure([
+            'sqlite:///' + os.path.join(self.replica_path, 'missing', 'replica.db')])
+        db.session.add(Venue(name='Primary Lounge', city='San Francisco', state='CA'))
+        db.session.commit()
+        # a fresh session, or its write keeps the request on the primary, and
+        # past the invalidation that reads the next page from the primary
+        db.session.remove()
+        page_cache.clear()
+        self.assertIn(b'Primary Lounge', self.client.get('/venues').data)
+        status = self.client.get('/internal/pool').get_json()['replicas']
+        self.assertEqual([replica['available'] for replica in status.values()], [False])
+
+
+class QueryPlanTestCase(unittest.TestCase):
+    """Fails when a page query falls back to a full scan of shows or genres"""
+
+    SEQUENTIAL_SCAN = re.compile(
+        r'^SCAN (TABLE )?(shows|genres|show_calendar)\b|^SEARCH (TABLE )?(shows|genres|show_calendar) USING AUTOMATIC|'
+        r'Seq Scan on (shows|genres|show_calendar)\b')
+
+    def setUp(self):
+        """Seed enough rows for the planner to prefer indexes."""
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+        now = datetime.now()
+        db.session.execute(Venue.__table__.insert(), [
+            {'name': 'Venue %d' % i, 'city': 'City %d' % (i % 20), 'state': 'CA'} for i in range(500)])
+        db.session.execute(Artist.__table__.insert(), [
+            {'name': 'Artist %d' % i, 'city': 'City %d' % (i % 20), 'state': 'CA'} for i in range(200)])
+        db.session.execute(Show.__table__.insert(), [
+            {'venue_id': i % 500 + 1, 'artist_id': i % 200 + 1,
+             'start_time': now + timedelta(hours=i - 2500)} for i in range(5000)])
+        db.session.execute(Genre.__table__.insert(), [{'name': 'Genre %d' % i} for i in range(20)])
+        db.session.execute(venue_genres.insert(), [
+            {'venue_id': i + 1, 'genre_id': i % 20 + 1} for i in range(500)])
+        db.session.execute(artist_genres.insert(), [
+            {'artist_id': i + 1, 'genre_id': i % 20 + 1} for i in range(200)])
+        db.session.commit()
+        db.session.execute(db.text('ANALYZE'))
+        db.session.remove()
+
+    def tearDown(self):
+        """Executed after each test"""
+        db.session.remove()
+        db.drop_all()
+        genre_id_cache.clear()
+        page_cache.clear()
+        self.ctx.pop()
+
+    def explain(self, fn):
+        """Runs fn and returns the query plan lines of every statement it issued."""
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append((statement, parameters))
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            fn()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+        prefix = 'EXPLAIN QUERY PLAN ' if db.engine.dialect.name == 'sqlite' else 'EXPLAIN '
+        connection = db.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            plan = []
+            for statement, parameters in statements:
+                cursor.execute(prefix + statement, parameters)
+                plan.extend(row[-1] for row in cursor.fetchall())
+            return plan
+        finally:
+            connection.close()
+
+    def assertNoSequentialScan(self, fn):
+        scans = [line for line in self.explain(fn) if self.SEQUENTIAL_SCAN.search(line.strip())]
+        self.assertEqual(scans, [])
+
+    def test_detail_pages_use_indexes(self):
+        self.assertNoSequentialScan(lambda: venue_detail(42))
+        self.assertNoSequentialScan(lambda: artist_detail(42))
+
+    def test_search_uses_indexes(self):
+        self.assertNoSequentialScan(lambda: search_with_upcoming_shows(Venue, 'Venue 4'))
+        self.assertNoSequentialScan(lambda: search_with_upcoming_shows(Artist, 'Artist 4'))
+
+    def test_calendar_uses_index(self):
+        today = datetime.now().date()
+        self.assertNoSequentialScan(lambda: calendar_listing('City 3', 'CA', today, today + timedelta(days=2)))
+
+    def test_venue_directory_counts_use_indexes(self):
+        self.assertNoSequentialScan(venue_directory)
+        genre_id('Genre 3')  # the genre id map is loaded once with a full read
+        self.assertNoSequentialScan(lambda: venue_directory(genre='Genre 3'))
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,33 @@
+# Shared helpers for the trivia benchmarks.
+#
+# Run the benchmarks from the backend directory, e.g.
+#   python -m benchmarks.quiz
+# They point the models at DATABASE_URL (a throwaway SQLite file by default)
+# and empty the questions and categories tables before seeding, so never aim
+# them at a database you care about.
+
+import os
+import tempfile
+import time
+
+from flask import Flask
+
+from models import setup_db, db
+from loader import create_schema, load_synthetic, CATEGORIES, NAMES, WORDS
+
+DATABASE_URL = os.environ.get(
+  'DATABASE_URL',
+  'sqlite:///' + os.path.join(tempfile.gettempdir(), 'trivia_bench.db'))
+
+app = Flask(__name__)
+with app.app_context():
+  setup_db(app, DATABASE_URL)
+  create_schema()
+
+
+def seed(questions, seed=1):
+  # Replaces the questions with `questions` synthetic ones spread evenly
+  # over CATEGORIES, bulk-loaded by loader.load_synthetic.
+  start = time.perf_counter()
+  load_synthetic(questions, reset=True, seed=seed)
+  print('seeded %d questions in %.1fs' % (questions, time.perf_counter() - start))
@@ -0,0 +1,57 @@
+# Time to draw the next quiz question of a category, excluding the previous
+# answers: the planned approach (load every matching question, drop the
+# previous ones, random.choice) against quiz.QuizEngine.
+#
+#   python -m benchmarks.quiz [questions] [previous answers] [draws]
+#
+# Defaults to 1,000,000 questions and 500 previous answers.
+
+import random
+import sys
+import time
+
+from benchmarks.common import app, db, seed, CATEGORIES
+from models import Question
+from quiz import QuizEngine
+
+
+def naive_question(category, previous_questions):
+  questions = Question.query.filter(Question.category == category)\
+    .filter(~Question.id.in_(previous_questions)).all()
+  return random.choice(questions) if questions else None
+
+
+def timed(fn, draws):
+  # milliseconds per draw
+  start = time.perf_counter()
+  for _ in range(draws):
+    fn()
+    db.session.expunge_all()
+  return (time.perf_counter() - start) * 1000 / draws
+
+
+def main():
+  questions = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+  previous = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+  draws = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+  with app.app_context():
+    seed(questions)
+    category = 1
+    rnd = random.Random(1)
+    # previous answers of the same category, as a quiz would have them
+    previous_questions = rnd.sample(range(category, questions + 1, len(CATEGORIES)), previous)
+
+    engine = QuizEngine()
+    start = time.perf_counter()
+    with engine.lock:
+      engine.current()
+    print('engine loaded %d questions in %.2fs' % (questions, time.perf_counter() - start))
+
+    naive_draws = max(1, draws // 200)
+    print('%-12s %14s' % ('approach', 'ms per draw'))
+    print('%-12s %14.3f' % ('naive', timed(lambda: naive_question(category, previous_questions), naive_draws)))
+    print('%-12s %14.3f' % ('engine', timed(lambda: engine.next_question(category, previous_questions), draws)))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,49 @@
+# Latency of POST /questions/search's query (search.search_questions) over a
+# seeded corpus, for rare terms (made-up names matching a few hundred
+# questions) and common ones (WORDS, matching a large share of them).
+#
+#   python -m benchmarks.search [questions] [searches]
+#
+# Defaults to 1,000,000 questions. On SQLite this measures the FTS5
+# fallback; point DATABASE_URL at PostgreSQL for the GIN index.
+
+import random
+import sys
+import time
+
+from benchmarks.common import app, db, seed, NAMES, WORDS
+from search import search_questions
+
+
+def percentile(values, fraction):
+  # nearest-rank percentile of an already sorted list
+  return values[max(0, int(round(fraction * len(values))) - 1)]
+
+
+def latencies(terms):
+  values = []
+  for term in terms:
+    start = time.perf_counter()
+    search_questions(term)
+    values.append((time.perf_counter() - start) * 1000)
+    db.session.remove()
+  return sorted(values)
+
+
+def main():
+  questions = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+  searches = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+  rnd = random.Random(1)
+  with app.app_context():
+    seed(questions)
+    print('%-12s %9s %9s %9s' % ('terms', 'p50 ms', 'p95 ms', 'max ms'))
+    for name, terms in [
+        ('rare', [rnd.choice(NAMES) for _ in range(searches)]),
+        ('rare pair', ['%s %s' % (rnd.choice(NAMES), rnd.choice(WORDS)) for _ in range(searches)]),
+        ('common', [rnd.choice(WORDS) for _ in range(max(1, searches // 20))])]:
+      values = latencies(terms)
+      print('%-12s %9.2f %9.2f %9.2f' % (name, percentile(values, 0.5), percentile(values, 0.95), values[-1]))
+
+
+if __name__ == '__main__':
+  main()
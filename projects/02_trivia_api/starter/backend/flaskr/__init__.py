@@ -1,17 +1,60 @@
 import os
+import click
 from flask import Flask, request, abort, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 import random
 
-from models import setup_db, Question, Category
+from flask_migrate import Migrate
+
+from models import setup_db, database_path, db, Question, Category, question_counts, category_cache
+from quiz import quiz_engine
+from search import search_questions
+import loader
 
 QUESTIONS_PER_PAGE = 10
 
+def paginate_questions(category=None, cursor=None, page=1, per_page=QUESTIONS_PER_PAGE):
+  '''
+  One page of questions in id order, optionally of a single category, with
+  the LIMIT in SQL. With `cursor` (the last id of the previous page) the page
+  is read with WHERE id > :cursor, so deep pages cost as little as the first
+  one; `page` numbers use OFFSET and are kept for the frontend's page links.
+  Returns the formatted questions and the cursor of the next page, or None.
+  '''
+  query = Question.query.order_by(Question.id)
+  if category is not None:
+    query = query.filter(Question.category == category)
+  if cursor is not None:
+    query = query.filter(Question.id > cursor)
+  else:
+    query = query.offset((page - 1) * per_page)
+  questions = query.limit(per_page + 1).all()
+  next_cursor = questions[per_page - 1].id if len(questions) > per_page else None
+  return [question.format() for question in questions[:per_page]], next_cursor
+
+
 def create_app(test_config=None):
   # create and configure the app
   app = Flask(__name__)
-  setup_db(app)
+  # test_config may point the app at another database with DATABASE_PATH
+  setup_db(app, (test_config or {}).get('DATABASE_PATH', database_path))
+  Migrate(app, db)
+
+  @app.cli.command('load-trivia')
+  @click.argument('dump', required=False, type=click.Path(exists=True, dir_okay=False))
+  @click.option('--questions', type=int, help='Load this many synthetic questions instead of a dump.')
+  @click.option('--reset', is_flag=True, help='Empty the questions and categories tables first.')
+  def load_trivia(dump, questions, reset):
+    '''Bulk-load trivia.psql (or DUMP) or a synthetic question corpus,
+    creating the schema if the database is empty.'''
+    loader.create_schema()
+    if questions is not None:
+      loaded = loader.load_synthetic(questions, reset=reset)
+    else:
+      loaded = loader.load_dump(dump or loader.DUMP_PATH, reset=reset)
+    for table, count in sorted(loaded.items()):
+      click.echo('loaded %d %s' % (count, table))
   
   '''
   @TODO: Set up CORS. Allow '*' for origins. Delete the sample route after completing the TODOs
@@ -26,6 +69,12 @@ def create_app(test_config=None):
   Create an endpoint to handle GET requests 
   for all available categories.
   '''
+  @app.route('/categories')
+  def get_categories():
+    return jsonify({
+      'success': True,
+      'categories': category_cache.get()
+    })
 
 
   '''
@@ -40,6 +89,32 @@ def create_app(test_config=None):
   ten questions per page and pagination at the bottom of the screen for three pages.
   Clicking on the page numbers should update the questions. 
   '''
+  @app.route('/questions')
+  def get_questions():
+    return list_questions(request.args.get('category', type=int))
+
+  @app.route('/categories/<int:category_id>/questions')
+  def get_category_questions(category_id):
+    return list_questions(category_id)
+
+  def list_questions(category):
+    # ?cursor=<next_cursor of the previous page> or ?page=<n>; the totals
+    # come from question_counts instead of a COUNT(*) per request
+    cursor = request.args.get('cursor', type=int)
+    page = request.args.get('page', 1, type=int)
+    if page < 1:
+      abort(400)
+    questions, next_cursor = paginate_questions(category, cursor, page)
+    if not questions and (cursor is not None or page > 1):
+      abort(404)
+    return jsonify({
+      'success': True,
+      'questions': questions,
+      'total_questions': question_counts.get(category),
+      'categories': category_cache.get(),
+      'current_category': category,
+      'next_cursor': next_cursor
+    })
 
   '''
   @TODO: 
@@ -70,6 +145,27 @@ def create_app(test_config=None):
   only question that include that string within their question. 
   Try using the word "title" to start. 
   '''
+  @app.route('/questions/search', methods=['POST'])
+  def search():
+    # {"searchTerm": ..., "page": n}; matches question and answer words
+    # (not substrings), best matches first, see search.py
+    body = request.get_json(silent=True) or {}
+    search_term = (body.get('searchTerm') or '').strip()
+    try:
+      page = int(body.get('page', 1))
+    except (TypeError, ValueError):
+      abort(422)
+    if not search_term or page < 1:
+      abort(422)
+    questions, total = search_questions(search_term, page, QUESTIONS_PER_PAGE)
+    if not questions and page > 1:
+      abort(404)
+    return jsonify({
+      'success': True,
+      'questions': questions,
+      'total_questions': total,
+      'current_category': None
+    })
 
   '''
   @TODO: 
@@ -92,6 +188,24 @@ def create_app(test_config=None):
   one question at a time is displayed, the user is allowed to answer
   and shown whether they were correct or not. 
   '''
+  @app.route('/quizzes', methods=['POST'])
+  def play_quiz():
+    # {"previous_questions": [ids], "quiz_category": {"type": ..., "id": ...}};
+    # category id 0 stands for all categories. question is null once every
+    # question of the category has been asked.
+    body = request.get_json(silent=True) or {}
+    previous_questions = body.get('previous_questions') or []
+    category = (body.get('quiz_category') or {}).get('id') or None
+    try:
+      previous_questions = [int(question_id) for question_id in previous_questions]
+      category = int(category) if category is not None else None
+    except (TypeError, ValueError):
+      abort(422)
+    question = quiz_engine.next_question(category, previous_questions)
+    return jsonify({
+      'success': True,
+      'question': question.format() if question else None
+    })
 
   '''
   @TODO: 
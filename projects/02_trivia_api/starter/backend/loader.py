@@ -0,0 +1,191 @@
+import io
+import itertools
+import os
+import random
+import re
+from sqlalchemy import Integer, func, inspect, text
+
+from models import db, Question, Category, bump_cache_version, question_counts, category_cache
+from quiz import quiz_engine
+import search  # creates the search index with the tables
+
+'''
+Bulk loading
+    fills the questions and categories tables from trivia.psql or with a
+    synthetic corpus in a few statements instead of one INSERT per row:
+    PostgreSQL gets the rows with COPY, other databases with executemany in
+    batches. Rows loaded this way bypass the ORM events, so the caches of
+    this process are dropped once they are in, and the categories version is
+    bumped for the other processes.
+'''
+
+DUMP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'trivia.psql')
+
+BATCH_SIZE = 10000
+
+CATEGORIES = ['Science', 'Art', 'Geography', 'History', 'Entertainment', 'Sports']
+
+WORDS = ['river', 'painter', 'empire', 'planet', 'guitar', 'novel', 'island', 'battle',
+         'element', 'mountain', 'composer', 'ocean', 'king', 'film', 'desert', 'bridge']
+
+# 8000 made-up names, so a word matches a few hundred of a million questions
+# the way real names and places do, while WORDS match a large share of them
+SYLLABLES = ['ka', 'lo', 'mi', 'ra', 'ten', 'vo', 'shi', 'dun', 'pel', 'gor',
+             'an', 'bri', 'cor', 'del', 'fu', 'ham', 'is', 'jor', 'nex', 'tul']
+NAMES = [a + b + c for a in SYLLABLES for b in SYLLABLES for c in SYLLABLES]
+
+TABLES = [Category.__table__, Question.__table__]
+
+COPY_HEADER = re.compile(r'COPY (?:\w+\.)?(\w+) \(([^)]*)\) FROM stdin;')
+COPY_ESCAPE = re.compile(r'\\(.)')
+COPY_ESCAPES = {'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t', 'v': '\v'}
+
+
+def create_schema():
+  '''
+  Creates the tables that are missing. Returns True if the questions table
+  was one of them, i.e. the database was empty.
+  '''
+  created = Question.__tablename__ not in inspect(db.engine).get_table_names()
+  db.create_all()
+  return created
+
+
+def read_dump(path=DUMP_PATH):
+  '''
+  The COPY blocks of a pg_dump file, as (table, columns, lines) tuples, each
+  line a row in COPY text format.
+  '''
+  with open(path) as dump:
+    block = None
+    for line in dump:
+      line = line.rstrip('\n')
+      if block is None:
+        header = COPY_HEADER.match(line)
+        if header:
+          block = (header.group(1), [name.strip() for name in header.group(2).split(',')], [])
+      elif line == '\\.':
+        yield block
+        block = None
+      else:
+        block[2].append(line)
+
+
+def parse_copy_line(line, table, columns):
+  # a COPY text format line as an executemany parameter dict
+  row = {}
+  for name, value in zip(columns, line.split('\t')):
+    if value == '\\N':
+      value = None
+    else:
+      value = COPY_ESCAPE.sub(lambda match: COPY_ESCAPES.get(match.group(1), match.group(1)), value)
+      if isinstance(table.c[name].type, Integer):
+        value = int(value)
+    row[name] = value
+  return row
+
+
+def copy_lines(table, columns, lines, batch_size=BATCH_SIZE):
+  '''
+  Inserts rows given as COPY text format lines into `table`, with COPY on
+  PostgreSQL and executemany in batches of `batch_size` elsewhere.
+  '''
+  connection = db.session.connection()
+  if connection.dialect.name == 'postgresql':
+    cursor = connection.connection.cursor()
+    cursor.copy_expert('COPY %s (%s) FROM STDIN' % (table.name, ', '.join(columns)),
+                       io.StringIO(''.join(line + '\n' for line in lines)))
+    return
+  batch = []
+  for line in lines:
+    batch.append(parse_copy_line(line, table, columns))
+    if len(batch) == batch_size:
+      connection.execute(table.insert(), batch)
+      batch = []
+  if batch:
+    connection.execute(table.insert(), batch)
+
+
+def reset_tables():
+  # empties questions and categories, restarting their ids on PostgreSQL
+  connection = db.session.connection()
+  if connection.dialect.name == 'postgresql':
+    connection.execute(text('TRUNCATE questions, categories RESTART IDENTITY'))
+  else:
+    connection.execute(Question.__table__.delete())
+    connection.execute(Category.__table__.delete())
+
+
+def finish_load():
+  # moves the id sequences past the loaded ids, commits, and drops the caches
+  # the skipped ORM events would have kept current
+  connection = db.session.connection()
+  if connection.dialect.name == 'postgresql':
+    for table in TABLES:
+      connection.execute(text(
+        "SELECT setval(pg_get_serial_sequence('{0}', 'id'), coalesce(max(id), 1), max(id) IS NOT NULL) "
+        'FROM {0}'.format(table.name)))
+  bump_cache_version(connection, 'categories')
+  db.session.commit()
+  question_counts.invalidate()
+  category_cache.invalidate()
+  quiz_engine.reset()
+
+
+def load_dump(path=DUMP_PATH, reset=False, batch_size=BATCH_SIZE):
+  '''
+  Loads the categories and questions of a pg_dump file such as trivia.psql.
+  Returns the number of rows loaded per table.
+  '''
+  if reset:
+    reset_tables()
+  tables = dict((table.name, table) for table in TABLES)
+  loaded = {}
+  # categories first, for the questions' foreign key
+  blocks = sorted((block for block in read_dump(path) if block[0] in tables),
+                  key=lambda block: TABLES.index(tables[block[0]]))
+  for name, columns, lines in blocks:
+    copy_lines(tables[name], columns, lines, batch_size)
+    loaded[name] = len(lines)
+  finish_load()
+  return loaded
+
+
+def synthetic_questions(count, categories, start_id=1, seed=1):
+  '''
+  `count` made-up questions as COPY text format lines of id, question,
+  answer, difficulty and category, spread evenly over the `categories` ids.
+  '''
+  rnd = random.Random(seed)
+  for i in range(count):
+    yield '%d\t%s\t%s\t%d\t%d' % (
+      start_id + i,
+      'Which %s of %s is %s?' % (rnd.choice(WORDS), rnd.choice(NAMES).title(), ' '.join(rnd.sample(WORDS, 3))),
+      '%s %s' % (rnd.choice(NAMES).title(), rnd.choice(NAMES).title()),
+      rnd.randint(1, 5),
+      categories[i % len(categories)])
+
+
+def load_synthetic(count, reset=False, seed=1, batch_size=BATCH_SIZE):
+  '''
+  Adds `count` synthetic questions after the existing ones, and the
+  CATEGORIES if there are no categories yet. Returns the number of rows
+  loaded per table.
+  '''
+  if reset:
+    reset_tables()
+  loaded = {}
+  categories = [category_id for category_id, in db.session.query(Category.id).order_by(Category.id)]
+  if not categories:
+    categories = list(range(1, len(CATEGORIES) + 1))
+    copy_lines(Category.__table__, ['id', 'type'],
+               ['%d\t%s' % (i, name) for i, name in zip(categories, CATEGORIES)])
+    loaded['categories'] = len(categories)
+  start_id = (db.session.query(func.max(Question.id)).scalar() or 0) + 1
+  lines = synthetic_questions(count, categories, start_id, seed)
+  for _ in range(0, count, batch_size):
+    copy_lines(Question.__table__, ['id', 'question', 'answer', 'difficulty', 'category'],
+               list(itertools.islice(lines, batch_size)), batch_size)
+  loaded['questions'] = count
+  finish_load()
+  return loaded
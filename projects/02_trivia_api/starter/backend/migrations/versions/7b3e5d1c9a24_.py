@@ -0,0 +1,88 @@
+"""question category as an integer foreign key, cache versions
+
+Revision ID: 7b3e5d1c9a24
+Revises:
+Create Date: 2026-10-18 18:52:11.240517
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7b3e5d1c9a24'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def create_trivia_tables(bind, inspector):
+    # an empty database: the tables and search index trivia.psql creates,
+    # with category already an integer foreign key
+    from search import POSTGRES_SEARCH_DDL, SQLITE_SEARCH_DDL
+    if 'categories' not in inspector.get_table_names():
+        op.create_table('categories',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('type', sa.Text(), nullable=True),
+            sa.PrimaryKeyConstraint('id')
+        )
+    op.create_table('questions',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('question', sa.Text(), nullable=True),
+        sa.Column('answer', sa.Text(), nullable=True),
+        sa.Column('difficulty', sa.Integer(), nullable=True),
+        sa.Column('category', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['category'], ['categories.id'], name='category',
+                                onupdate='CASCADE', ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    statements = {'postgresql': POSTGRES_SEARCH_DDL, 'sqlite': SQLITE_SEARCH_DDL}
+    for statement in statements.get(bind.dialect.name, []):
+        op.execute(statement)
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if 'questions' not in inspector.get_table_names():
+        create_trivia_tables(bind, inspector)
+        inspector = sa.inspect(bind)
+    # databases restored from trivia.psql already have an integer category
+    # with its foreign key; ones created from the earlier model by
+    # create_all have a string column and no constraint
+    category = [column for column in inspector.get_columns('questions') if column['name'] == 'category'][0]
+    has_foreign_key = any(foreign_key['referred_table'] == 'categories'
+                          for foreign_key in inspector.get_foreign_keys('questions'))
+    if not isinstance(category['type'], sa.Integer) or not has_foreign_key:
+        op.execute('UPDATE questions SET category = NULL '
+                   'WHERE category NOT IN (SELECT CAST(id AS VARCHAR) FROM categories)')
+        with op.batch_alter_table('questions') as batch_op:
+            if not isinstance(category['type'], sa.Integer):
+                batch_op.alter_column('category', existing_type=sa.String(), type_=sa.Integer(),
+                                      postgresql_using='category::integer')
+            if not has_foreign_key:
+                batch_op.create_foreign_key('category', 'categories', ['category'], ['id'],
+                                            onupdate='CASCADE', ondelete='SET NULL')
+        if bind.dialect.name == 'sqlite':
+            # the batch copy of the table drops the search triggers, and the
+            # search table may not have been created with it
+            from search import SQLITE_SEARCH_DDL
+            for statement in SQLITE_SEARCH_DDL:
+                op.execute(statement)
+            op.execute("INSERT INTO questions_search (questions_search) VALUES ('rebuild')")
+    if 'ix_questions_category_id' not in [index['name'] for index in inspector.get_indexes('questions')]:
+        op.create_index('ix_questions_category_id', 'questions', ['category', 'id'], unique=False)
+
+    # create_all (flask load-trivia) may have made it already
+    if 'cache_versions' not in inspector.get_table_names():
+        cache_versions = op.create_table('cache_versions',
+            sa.Column('name', sa.String(), nullable=False),
+            sa.Column('version', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('name')
+        )
+        op.bulk_insert(cache_versions, [{'name': 'categories', 'version': 0}])
+
+
+def downgrade():
+    # category stays an integer foreign key, as trivia.psql has always had it
+    op.drop_table('cache_versions')
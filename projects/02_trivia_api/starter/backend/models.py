@@ -1,5 +1,7 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+import time
+from collections import OrderedDict
+from sqlalchemy import Column, String, Integer, ForeignKey, Index, create_engine, event, func
 from flask_sqlalchemy import SQLAlchemy
 import json
 
@@ -10,14 +12,15 @@ db = SQLAlchemy()
 
 '''
 setup_db(app)
-    binds a flask application and a SQLAlchemy service
+    binds a flask application and a SQLAlchemy service. The schema is left
+    to `flask db upgrade`, or to `flask load-trivia` for an empty database
+    (see loader.py), instead of being checked on every start.
 '''
 def setup_db(app, database_path=database_path):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
     db.app = app
     db.init_app(app)
-    db.create_all()
 
 '''
 Question
@@ -25,11 +28,16 @@ Question
 '''
 class Question(db.Model):  
   __tablename__ = 'questions'
+  __table_args__ = (
+    # serves "questions of a category" pages, which filter on category and
+    # walk id order
+    Index('ix_questions_category_id', 'category', 'id'),
+  )
 
   id = Column(Integer, primary_key=True)
   question = Column(String)
   answer = Column(String)
-  category = Column(String)
+  category = Column(Integer, ForeignKey('categories.id', name='category', onupdate='CASCADE', ondelete='SET NULL'))
   difficulty = Column(Integer)
 
   def __init__(self, question, answer, category, difficulty):
@@ -75,4 +83,96 @@ class Category(db.Model):
     return {
       'id': self.id,
       'type': self.type
-    }
\ No newline at end of file
+    }
+
+
+'''
+QuestionCounts
+    number of questions in total and per category, loaded with a single
+    GROUP BY and kept until a question is inserted, deleted or changed in
+    this process, or for at most `ttl` seconds so writes made by other
+    processes show up too
+'''
+class QuestionCounts(object):
+
+  def __init__(self, ttl=60):
+    self.ttl = ttl
+    self.counts = None
+    self.loaded_at = 0
+
+  def get(self, category=None):
+    counts = self.counts
+    if counts is None or time.time() - self.loaded_at > self.ttl:
+      rows = db.session.query(Question.category, func.count(Question.id)).group_by(Question.category).all()
+      counts = dict((category_id, count) for category_id, count in rows if category_id is not None)
+      counts[None] = sum(count for _, count in rows)
+      self.counts, self.loaded_at = counts, time.time()
+    return counts.get(category, 0)
+
+  def invalidate(self, *args):
+    self.counts = None
+
+question_counts = QuestionCounts()
+
+for name in ('after_insert', 'after_update', 'after_delete'):
+  event.listen(Question, name, question_counts.invalidate)
+
+
+'''
+cache_versions
+    a version number per cached table, bumped in the same transaction as
+    every change to it, so each process can tell whether its copy is stale
+    by reading a single row
+'''
+cache_versions = db.Table('cache_versions',
+  Column('name', String, primary_key=True),
+  Column('version', Integer, nullable=False, default=0),
+)
+
+@event.listens_for(cache_versions, 'after_create')
+def create_cache_versions(target, connection, **kw):
+  connection.execute(cache_versions.insert(), [{'name': 'categories', 'version': 0}])
+
+def bump_cache_version(connection, name):
+  connection.execute(cache_versions.update()
+    .where(cache_versions.c.name == name)
+    .values(version=cache_versions.c.version + 1))
+
+
+'''
+CategoryCache
+    every category as an id: type map, shared by the requests of a process.
+    Categories almost never change, so the map is kept until the categories
+    version in cache_versions moves on, which is checked at most every
+    `check_interval` seconds; changes made in this process drop it at once.
+'''
+class CategoryCache(object):
+
+  def __init__(self, check_interval=5):
+    self.check_interval = check_interval
+    self.categories = None
+    self.version = None
+    self.checked_at = 0
+
+  def get(self):
+    now = time.time()
+    if self.categories is None or now - self.checked_at > self.check_interval:
+      version = db.session.query(cache_versions.c.version)\
+        .filter(cache_versions.c.name == 'categories').scalar()
+      if self.categories is None or version != self.version:
+        self.categories = OrderedDict(db.session.query(Category.id, Category.type).order_by(Category.id))
+        self.version = version
+      self.checked_at = now
+    return self.categories
+
+  def invalidate(self):
+    self.categories = None
+
+category_cache = CategoryCache()
+
+def category_changed(mapper, connection, target):
+  bump_cache_version(connection, 'categories')
+  category_cache.invalidate()
+
+for name in ('after_insert', 'after_update', 'after_delete'):
+  event.listen(Category, name, category_changed)
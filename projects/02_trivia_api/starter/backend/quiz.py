@@ -0,0 +1,136 @@
+import random
+import threading
+import time
+from sqlalchemy import event
+
+from models import db, Question
+
+'''
+QuestionPool
+    the ids of one category's questions in an array, plus the position of
+    each id in it, so adding, removing and drawing an id all take O(1)
+'''
+class QuestionPool(object):
+
+  def __init__(self):
+    self.ids = []
+    self.positions = {}
+
+  def __len__(self):
+    return len(self.ids)
+
+  def add(self, question_id):
+    if question_id not in self.positions:
+      self.positions[question_id] = len(self.ids)
+      self.ids.append(question_id)
+
+  def remove(self, question_id):
+    # moves the last id into the hole
+    position = self.positions.pop(question_id, None)
+    if position is None:
+      return
+    last = self.ids.pop()
+    if last != question_id:
+      self.ids[position] = last
+      self.positions[last] = position
+
+  def draw(self, excluded, rnd=random):
+    # A random id that is not in the `excluded` set, or None. While less
+    # than half of the pool is excluded a random pick is accepted at least
+    # every other try, so this takes O(1) expected however many questions
+    # and previous answers there are; past that the remaining ids are listed
+    # once, in time proportional to the excluded ones.
+    count = len(self.ids)
+    if count and len(excluded) * 2 < count:
+      while True:
+        question_id = self.ids[rnd.randrange(count)]
+        if question_id not in excluded:
+          return question_id
+    remaining = [question_id for question_id in self.ids if question_id not in excluded]
+    return rnd.choice(remaining) if remaining else None
+
+
+'''
+QuizEngine
+    question pools per category (and one for all questions) held in memory,
+    loaded with one query and kept current by the Question insert, update
+    and delete events of this process. The pools are reloaded every `ttl`
+    seconds to pick up questions added by other processes; ids they deleted
+    are dropped when drawn.
+
+    A quiz session is the list of its previous questions, sent with every
+    request, so questions are drawn without replacement without keeping any
+    state between requests.
+'''
+class QuizEngine(object):
+
+  def __init__(self, ttl=300):
+    self.ttl = ttl
+    self.pools = None
+    self.loaded_at = 0
+    self.lock = threading.Lock()
+
+  def load(self):
+    pools = {None: QuestionPool()}
+    for question_id, category in db.session.query(Question.id, Question.category).yield_per(10000):
+      pools[None].add(question_id)
+      if category is not None:
+        pools.setdefault(category, QuestionPool()).add(question_id)
+    return pools
+
+  def current(self):
+    # called with the lock held
+    if self.pools is None or time.time() - self.loaded_at > self.ttl:
+      self.pools = self.load()
+      self.loaded_at = time.time()
+    return self.pools
+
+  def next_question(self, category=None, previous_questions=(), rnd=random):
+    '''
+    A random Question of `category` (any category for None) that is not in
+    `previous_questions`, or None once they have all been asked.
+    '''
+    excluded = set(previous_questions)
+    while True:
+      with self.lock:
+        pool = self.current().get(category)
+        question_id = pool.draw(excluded, rnd) if pool is not None else None
+      if question_id is None:
+        return None
+      question = Question.query.get(question_id)
+      if question is not None:
+        return question
+      # deleted by another process, or inserted by a rolled back transaction
+      self.discard(question_id)
+
+  def add(self, question):
+    with self.lock:
+      if self.pools is not None:
+        self.pools[None].add(question.id)
+        if question.category is not None:
+          self.pools.setdefault(question.category, QuestionPool()).add(question.id)
+
+  def discard(self, question_id):
+    with self.lock:
+      if self.pools is not None:
+        for pool in self.pools.values():
+          pool.remove(question_id)
+
+  def reset(self):
+    with self.lock:
+      self.pools = None
+
+quiz_engine = QuizEngine()
+
+@event.listens_for(Question, 'after_insert')
+def add_quiz_question(mapper, connection, target):
+  quiz_engine.add(target)
+
+@event.listens_for(Question, 'after_update')
+def move_quiz_question(mapper, connection, target):
+  quiz_engine.discard(target.id)
+  quiz_engine.add(target)
+
+@event.listens_for(Question, 'after_delete')
+def remove_quiz_question(mapper, connection, target):
+  quiz_engine.discard(target.id)
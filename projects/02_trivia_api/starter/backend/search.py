@@ -0,0 +1,102 @@
+import re
+from sqlalchemy import event, text
+
+from models import db, Question
+
+'''
+Question search
+    full-text search over question and answer text. On PostgreSQL it uses a
+    GIN index on their english tsvector (ix_questions_search, also created
+    by trivia.psql); SQLite has no tsvector, so there the questions_search
+    FTS5 table, kept in sync by triggers, stands in for it. Matches are
+    ranked, paged and highlighted with <mark> in the database, so a search
+    reads only the index and the page of rows it returns.
+'''
+
+SEARCH_VECTOR = "to_tsvector('english', coalesce(question, '') || ' ' || coalesce(answer, ''))"
+
+POSTGRES_SEARCH_DDL = [
+  'CREATE INDEX IF NOT EXISTS ix_questions_search ON questions USING gin (%s)' % SEARCH_VECTOR,
+]
+
+SQLITE_SEARCH_DDL = [
+  "CREATE VIRTUAL TABLE IF NOT EXISTS questions_search USING fts5("
+  "question, answer, content='questions', content_rowid='id', tokenize='porter unicode61')",
+  'CREATE TRIGGER IF NOT EXISTS questions_search_ai AFTER INSERT ON questions BEGIN '
+  'INSERT INTO questions_search (rowid, question, answer) VALUES (new.id, new.question, new.answer); END',
+  'CREATE TRIGGER IF NOT EXISTS questions_search_ad AFTER DELETE ON questions BEGIN '
+  "INSERT INTO questions_search (questions_search, rowid, question, answer) "
+  "VALUES ('delete', old.id, old.question, old.answer); END",
+  'CREATE TRIGGER IF NOT EXISTS questions_search_au AFTER UPDATE OF question, answer ON questions BEGIN '
+  "INSERT INTO questions_search (questions_search, rowid, question, answer) "
+  "VALUES ('delete', old.id, old.question, old.answer); "
+  'INSERT INTO questions_search (rowid, question, answer) VALUES (new.id, new.question, new.answer); END',
+]
+
+# only the page of matches gets highlighted
+POSTGRES_SEARCH = text('''
+SELECT id, question, answer, category, difficulty, total,
+  ts_headline('english', coalesce(question, ''), query, 'StartSel=<mark>, StopSel=</mark>, HighlightAll=TRUE'),
+  ts_headline('english', coalesce(answer, ''), query, 'StartSel=<mark>, StopSel=</mark>, HighlightAll=TRUE')
+FROM (
+  SELECT id, question, answer, category, difficulty, query, count(*) OVER () AS total,
+    ts_rank_cd(%s, query) AS rank
+  FROM questions, websearch_to_tsquery('english', :term) query
+  WHERE %s @@ query
+  ORDER BY rank DESC, id
+  LIMIT :limit OFFSET :offset
+) matches
+ORDER BY rank DESC, id
+''' % (SEARCH_VECTOR, SEARCH_VECTOR))
+
+SQLITE_SEARCH = text('''
+SELECT q.id, q.question, q.answer, q.category, q.difficulty,
+  (SELECT count(*) FROM questions_search WHERE questions_search MATCH :term),
+  highlight(questions_search, 0, '<mark>', '</mark>'),
+  highlight(questions_search, 1, '<mark>', '</mark>')
+FROM questions_search JOIN questions q ON q.id = questions_search.rowid
+WHERE questions_search MATCH :term
+ORDER BY questions_search.rank, q.id
+LIMIT :limit OFFSET :offset
+''')
+
+@event.listens_for(Question.__table__, 'after_create')
+def create_search_index(target, connection, **kw):
+  statements = {'postgresql': POSTGRES_SEARCH_DDL, 'sqlite': SQLITE_SEARCH_DDL}
+  for statement in statements.get(connection.dialect.name, []):
+    connection.execute(text(statement))
+
+@event.listens_for(Question.__table__, 'before_drop')
+def drop_search_index(target, connection, **kw):
+  if connection.dialect.name == 'sqlite':
+    connection.execute(text('DROP TABLE IF EXISTS questions_search'))
+
+
+def search_questions(search_term, page=1, per_page=10):
+  '''
+  One page of the questions whose question or answer text matches
+  `search_term`, best matches first, each with `highlights` of both texts.
+  Returns the questions and the total number of matches.
+  '''
+  if db.session.get_bind().dialect.name == 'postgresql':
+    statement, term = POSTGRES_SEARCH, search_term
+  else:
+    # every word has to match; quoting keeps FTS5 operators out
+    words = re.findall(r'\w+', search_term)
+    if not words:
+      return [], 0
+    statement, term = SQLITE_SEARCH, ' '.join('"%s"' % word for word in words)
+  rows = db.session.execute(statement, {
+    'term': term,
+    'limit': per_page,
+    'offset': (page - 1) * per_page
+  }).fetchall()
+  questions = [{
+    'id': id,
+    'question': question,
+    'answer': answer,
+    'category': category,
+    'difficulty': difficulty,
+    'highlights': {'question': question_highlight, 'answer': answer_highlight}
+  } for id, question, answer, category, difficulty, _, question_highlight, answer_highlight in rows]
+  return questions, rows[0][5] if rows else 0
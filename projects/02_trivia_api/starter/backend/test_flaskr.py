@@ -1,39 +1,193 @@
 import os
 import unittest
 import json
-from flask_sqlalchemy import SQLAlchemy
+import sqlalchemy
+from sqlalchemy import event, text
+from sqlalchemy.orm import scoped_session, sessionmaker
 
 from flaskr import create_app
-from models import setup_db, Question, Category
+from models import db, Question, Category, question_counts, category_cache
+from quiz import quiz_engine
+import loader
+
+
+database_name = "trivia_test"
+database_path = os.environ.get(
+    'TEST_DATABASE_URL', "postgres://{}/{}".format('localhost:5432', database_name))
+app = None
+
+# SQLAlchemy 2 turns the commits of a session bound to a connection in a
+# transaction into savepoints only when asked to; 1.x never commits it
+TEST_SESSION_OPTIONS = {'join_transaction_mode': 'create_savepoint'} \
+    if sqlalchemy.__version__ >= '2' else {}
+
+
+def setUpModule():
+    """Create the app once, and the schema and trivia.psql's rows if the
+    database is empty, instead of before every test."""
+    global app
+    app = create_app({'DATABASE_PATH': database_path})
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            # pysqlite starts transactions on its own and breaks SAVEPOINT;
+            # let SQLAlchemy emit BEGIN instead
+            @event.listens_for(db.engine, 'connect')
+            def disable_pysqlite_transactions(dbapi_connection, connection_record):
+                dbapi_connection.isolation_level = None
+
+            @event.listens_for(db.engine, 'begin')
+            def begin(connection):
+                connection.exec_driver_sql('BEGIN')
+
+        if loader.create_schema():
+            loader.load_dump()
 
 
 class TriviaTestCase(unittest.TestCase):
     """This class represents the trivia test case"""
 
     def setUp(self):
-        """Define test variables and initialize app."""
-        self.app = create_app()
+        """Define test variables and run the test in a transaction."""
+        self.app = app
         self.client = self.app.test_client
-        self.database_name = "trivia_test"
-        self.database_path = "postgres://{}/{}".format('localhost:5432', self.database_name)
-        setup_db(self.app, self.database_path)
-
-        # binds the app to the current context
-        with self.app.app_context():
-            self.db = SQLAlchemy()
-            self.db.init_app(self.app)
-            # create all tables
-            self.db.create_all()
-    
+        self.context = self.app.app_context()
+        self.context.push()
+
+        # db.session is swapped for a session on a connection whose outer
+        # transaction tearDown rolls back, so whatever a test commits is undone
+        self.connection = db.engine.connect()
+        self.transaction = self.connection.begin()
+        self.session = db.session
+        db.session = scoped_session(sessionmaker(bind=self.connection, **TEST_SESSION_OPTIONS))
+
     def tearDown(self):
         """Executed after reach test"""
-        pass
+        db.session.remove()
+        db.session = self.session
+        self.transaction.rollback()
+        self.connection.close()
+        # the in-process caches may hold rows of the rolled back transaction
+        question_counts.invalidate()
+        category_cache.invalidate()
+        quiz_engine.reset()
+        self.context.pop()
 
     """
     TODO
     Write at least one test for each test for successful operation and for expected errors.
     """
 
+    def test_get_categories(self):
+        res = self.client().get('/categories')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        self.assertEqual(data['categories']['1'], 'Science')
+
+    def test_get_paginated_questions(self):
+        res = self.client().get('/questions')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        self.assertEqual(len(data['questions']), 10)
+        self.assertTrue(data['total_questions'])
+        self.assertTrue(len(data['categories']))
+        self.assertTrue(data['next_cursor'])
+
+    def test_questions_cursor_continues_after_last_id(self):
+        first = json.loads(self.client().get('/questions').data)
+        res = self.client().get('/questions?cursor={}'.format(first['next_cursor']))
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(all(question['id'] > first['next_cursor'] for question in data['questions']))
+        self.assertEqual(data['questions'], json.loads(self.client().get('/questions?page=2').data)['questions'])
+
+    def test_get_questions_by_category(self):
+        res = self.client().get('/categories/1/questions')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['current_category'], 1)
+        self.assertEqual(data['total_questions'], len(data['questions']))
+        self.assertTrue(all(question['category'] == 1 for question in data['questions']))
+
+    def test_404_beyond_last_page(self):
+        res = self.client().get('/questions?page=1000')
+
+        self.assertEqual(res.status_code, 404)
+
+    def test_search_questions(self):
+        res = self.client().post('/questions/search', json={'searchTerm': 'title'})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['total_questions'])
+        self.assertEqual(data['total_questions'], len(data['questions']))
+        self.assertIn('<mark>title</mark>', data['questions'][0]['highlights']['question'])
+
+    def test_422_search_without_term(self):
+        res = self.client().post('/questions/search', json={'searchTerm': ' '})
+
+        self.assertEqual(res.status_code, 422)
+
+    def test_play_quiz_skips_previous_questions(self):
+        previous_questions = []
+        while True:
+            res = self.client().post('/quizzes', json={
+                'previous_questions': previous_questions,
+                'quiz_category': {'type': 'Science', 'id': 1}})
+            data = json.loads(res.data)
+            self.assertEqual(res.status_code, 200)
+            if data['question'] is None:
+                break
+            self.assertNotIn(data['question']['id'], previous_questions)
+            self.assertEqual(data['question']['category'], 1)
+            previous_questions.append(data['question']['id'])
+
+        self.assertEqual(len(previous_questions),
+                         json.loads(self.client().get('/categories/1/questions').data)['total_questions'])
+
+    def test_422_quiz_with_bad_previous_questions(self):
+        res = self.client().post('/quizzes', json={'previous_questions': ['one']})
+
+        self.assertEqual(res.status_code, 422)
+
+    def test_read_dump(self):
+        blocks = dict((table, (columns, lines)) for table, columns, lines in loader.read_dump())
+
+        self.assertEqual(blocks['categories'][0], ['id', 'type'])
+        self.assertEqual(len(blocks['categories'][1]), 6)
+        self.assertEqual(loader.parse_copy_line(blocks['categories'][1][0], Category.__table__,
+                                                blocks['categories'][0]), {'id': 1, 'type': 'Science'})
+        self.assertIn('questions', blocks)
+
+    def test_load_synthetic_questions(self):
+        total = json.loads(self.client().get('/questions').data)['total_questions']
+        loaded = loader.load_synthetic(25)
+        data = json.loads(self.client().get('/questions').data)
+
+        self.assertEqual(loaded, {'questions': 25})
+        self.assertEqual(data['total_questions'], total + 25)
+        self.assertEqual(Question.query.count(), total + 25)
+
+    def test_commits_are_rolled_back(self):
+        with db.engine.connect() as connection:
+            total = connection.execute(text('SELECT count(*) FROM questions')).scalar()
+        question = Question('Is this question rolled back?', 'Yes', 1, 1)
+        question.insert()
+        result = self.app.test_cli_runner().invoke(args=['load-trivia', '--questions', '5'])
+
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(Question.query.count(), total + 6)
+        # outside the test's transaction none of it was committed
+        with db.engine.connect() as connection:
+            self.assertEqual(connection.execute(text('SELECT count(*) FROM questions')).scalar(), total)
+            self.assertIsNone(connection.execute(
+                text('SELECT id FROM questions WHERE id = :id'), {'id': question.id}).first())
+
 
 # Make the tests conveniently executable
 if __name__ == "__main__":